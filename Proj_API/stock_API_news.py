@@ -32,8 +32,6 @@ import datetime
 
 import io
 
-# 設置標準輸出的編碼
-sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
 
 # Load environment variables
@@ -167,7 +165,11 @@ def insert_news_if_not_exists(stock_id, title, news_date, content, source, news_
         print(f"Duplicate news found for stock ID: {stock_id}. Skipping insertion.")
 
 # Main process
-def main():
+def main(pages=None):
+    """
+    抓取最近一個月的新聞並存到 Supabase，可在常駐的 worker 中重複呼叫
+    pages: 與其他爬蟲的介面一致，NewsAPI 不分頁所以不使用
+    """
     stock_ids = get_all_stock_ids()
 
     if not stock_ids:
@@ -216,6 +218,7 @@ def main():
 
 
 if __name__ == "__main__":
-    pages=int(sys.argv[1])
-    main()
+    # 設置標準輸出的編碼
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else None)
     print(get_all_stock_ids())
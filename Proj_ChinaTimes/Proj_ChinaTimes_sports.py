@@ -21,8 +21,6 @@ from langchain_google_genai import ChatGoogleGenerativeAI
 from google.generativeai.types import HarmBlockThreshold
 from google.ai.generativelanguage_v1 import HarmCategory
 
-pages=int(sys.argv[1])
-
 # 常見的 User-Agent 列表(這是一種adaptive)
 user_agents = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/85.0.4183.121 Safari/537.36",
@@ -156,7 +154,7 @@ def check_news_count(sport_id, news_date):
         print(f"Error checking news count for {sport_id} on {news_date}: {e}")
         return 0
 test=0     
-def gemini_response(news, title):
+def gemini_response(news, title, sport_name):
     global test  # 指示使用全域變數
     model = 'gemini-1.5-flash'
     temperature = 1
@@ -209,59 +207,68 @@ def gemini_response(news, title):
 
     return "運動新聞"  # 如果新聞相關，返回相應的結果
 
-# 从 Supabase 中获取所有運動類關鍵字的 sportID
-sports_response = supabase.table("sport").select("sportID").execute()
-
-# 確認是否拿到資料
-if not sports_response or not sports_response.data:
-    print(f"Error fetching sport IDs: {sports_response}")
-    exit()
-
-sport_ids = sports_response.data  # 获取 sportID 数据
-
-# 循环，控制总爬取的页数
-for current_page in range(1, pages+1, 3):  # 每次迭代爬取3页
-    print(f'current page: {current_page}')
-    for sport in sport_ids:
-        sport_id = sport['sportID']
-        
-        # 使用 get_sport_name 函数获取 sport_name
-        sport_name = get_sport_name(sport_id)
-        
-        if not sport_name:
-            print(f"Skipping sport ID {sport_id} due to missing sport name.")
-            continue
 
-        end_page = min(current_page + 2, pages)  # 設定結束頁面為當前頁的3頁之後或1500
-
-        # 爬取新聞（包括標題、連結、日期和內容）
-        news_list = fetch_news_chinatime(sport_id, sport_name, current_page, end_page)
-        
-        for news in news_list:
-            try:
-                news_date = news["date"]
-                
-                # 檢查該日期是否已儲存3則新聞
-                if check_news_count(sport_id, news_date) >= 3:
-                    print(f"Already saved 3 news articles for {sport_id} on {news_date}. Skipping...")
-                    continue
-                
-                response = gemini_response(news["content"], news["headline"])
-                
-                if response == "非運動類別的新聞":
-                    print(f'非運動類別的新聞:內文({news["content"]})標題:({news["headline"]})')
-                    continue
-                
-                # 儲存到 Supabase
-                supabase.table("sport_news").insert({
-                    "sportID": int(sport_id),
-                    "title": news["headline"],
-                    "date": news["date"],
-                    "content": news["content"],
-                    "source": "China Times",
-                    "url": news["link"]
-                }).execute()
-                print(f"Saved news: {news['headline']} for sport ID: {sport_id} on date: {news['date']}")
-                
-            except Exception as e:
-                print(f"Error processing news for sport ID {sport_id}: {e}")
\ No newline at end of file
+def main(pages):
+    """
+    爬取 pages 頁的新聞並存到 Supabase，可在常駐的 worker 中重複呼叫
+    """
+    # 从 Supabase 中获取所有運動類關鍵字的 sportID
+    sports_response = supabase.table("sport").select("sportID").execute()
+
+    # 確認是否拿到資料
+    if not sports_response or not sports_response.data:
+        print(f"Error fetching sport IDs: {sports_response}")
+        return
+
+    sport_ids = sports_response.data  # 获取 sportID 数据
+
+    # 循环，控制总爬取的页数
+    for current_page in range(1, pages+1, 3):  # 每次迭代爬取3页
+        print(f'current page: {current_page}')
+        for sport in sport_ids:
+            sport_id = sport['sportID']
+
+            # 使用 get_sport_name 函数获取 sport_name
+            sport_name = get_sport_name(sport_id)
+
+            if not sport_name:
+                print(f"Skipping sport ID {sport_id} due to missing sport name.")
+                continue
+
+            end_page = min(current_page + 2, pages)  # 設定結束頁面為當前頁的3頁之後或1500
+
+            # 爬取新聞（包括標題、連結、日期和內容）
+            news_list = fetch_news_chinatime(sport_id, sport_name, current_page, end_page)
+
+            for news in news_list:
+                try:
+                    news_date = news["date"]
+
+                    # 檢查該日期是否已儲存3則新聞
+                    if check_news_count(sport_id, news_date) >= 3:
+                        print(f"Already saved 3 news articles for {sport_id} on {news_date}. Skipping...")
+                        continue
+
+                    response = gemini_response(news["content"], news["headline"], sport_name)
+
+                    if response == "非運動類別的新聞":
+                        print(f'非運動類別的新聞:內文({news["content"]})標題:({news["headline"]})')
+                        continue
+
+                    # 儲存到 Supabase
+                    supabase.table("sport_news").insert({
+                        "sportID": int(sport_id),
+                        "title": news["headline"],
+                        "date": news["date"],
+                        "content": news["content"],
+                        "source": "China Times",
+                        "url": news["link"]
+                    }).execute()
+                    print(f"Saved news: {news['headline']} for sport ID: {sport_id} on date: {news['date']}")
+
+                except Exception as e:
+                    print(f"Error processing news for sport ID {sport_id}: {e}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]))
@@ -151,7 +151,7 @@ def check_news_count(stock_id, news_date):
         print(f"Error checking news count for {stock_id} on {news_date}: {e}")
         return 0
     
-def gemini_response(news, title):
+def gemini_response(news, title, stock_name):
     model = 'gemini-1.5-flash'
     temperature = 1
     top_p = 0.9
@@ -202,59 +202,68 @@ def gemini_response(news, title):
 
     return "股市新聞"  # 如果新聞相關，返回相應的結果
 
-# 从 Supabase 中获取所有股票的 stockID
-stocks_response = supabase.table("stock").select("stockID").execute()
 
-# 確認是否拿到資料
-if not stocks_response or not stocks_response.data:
-    print(f"Error fetching stock IDs: {stocks_response}")
-    exit()
+def main(pages=1500):
+    """
+    爬取 pages 頁的新聞並存到 Supabase，可在常駐的 worker 中重複呼叫
+    """
+    # 从 Supabase 中获取所有股票的 stockID
+    stocks_response = supabase.table("stock").select("stockID").execute()
 
-stock_ids = stocks_response.data  # 获取 stockID 数据
+    # 確認是否拿到資料
+    if not stocks_response or not stocks_response.data:
+        print(f"Error fetching stock IDs: {stocks_response}")
+        return
 
-# 循环，控制总爬取的页数
-for current_page in range(1, 1501, 3):  # 每次迭代爬取3页
-    print(f'current page: {current_page}')
-    for stock in stock_ids:
-        stock_id = stock['stockID']
-        
-        # 使用 get_stock_name 函数获取 stock_name
-        stock_name = get_stock_name(stock_id)
-        
-        if not stock_name:
-            print(f"Skipping stock ID {stock_id} due to missing stock name.")
-            continue
+    stock_ids = stocks_response.data  # 获取 stockID 数据
 
-        end_page = min(current_page + 2, 1500)  # 設定結束頁面為當前頁的3頁之後或1500
+    # 循环，控制总爬取的页数
+    for current_page in range(1, pages+1, 3):  # 每次迭代爬取3页
+        print(f'current page: {current_page}')
+        for stock in stock_ids:
+            stock_id = stock['stockID']
 
-        # 爬取新聞（包括標題、連結、日期和內容）
-        news_list = fetch_news_tvbs(stock_id, stock_name, current_page, end_page)
-        
-        for news in news_list:
-            try:
-                news_date = news["date"]
-                
-                # 檢查該日期是否已儲存3則新聞
-                if check_news_count(stock_id, news_date) >= 3:
-                    print(f"Already saved 3 news articles for {stock_id} on {news_date}. Skipping...")
-                    continue
-                
-                response = gemini_response(news["content"], news["headline"])
-                
-                if response == "非股市新聞":
-                    print(f'非股市新聞:內文({news["content"]})標題:({news["headline"]})')
-                    continue
-                
-                # 儲存到 Supabase
-                supabase.table("stock_news").insert({
-                    "stockID": int(stock_id),
-                    "title": news["headline"],
-                    "date": news["date"],
-                    "content": news["content"],
-                    "source": "tvbs",
-                    "url": news["link"]
-                }).execute()
-                print(f"Saved news: {news['headline']} for stock ID: {stock_id} on date: {news['date']}")
-                
-            except Exception as e:
-                print(f"Error processing news for stock ID {stock_id}: {e}")
\ No newline at end of file
+            # 使用 get_stock_name 函数获取 stock_name
+            stock_name = get_stock_name(stock_id)
+
+            if not stock_name:
+                print(f"Skipping stock ID {stock_id} due to missing stock name.")
+                continue
+
+            end_page = min(current_page + 2, pages)  # 設定結束頁面為當前頁的3頁之後或1500
+
+            # 爬取新聞（包括標題、連結、日期和內容）
+            news_list = fetch_news_tvbs(stock_id, stock_name, current_page, end_page)
+
+            for news in news_list:
+                try:
+                    news_date = news["date"]
+
+                    # 檢查該日期是否已儲存3則新聞
+                    if check_news_count(stock_id, news_date) >= 3:
+                        print(f"Already saved 3 news articles for {stock_id} on {news_date}. Skipping...")
+                        continue
+
+                    response = gemini_response(news["content"], news["headline"], stock_name)
+
+                    if response == "非股市新聞":
+                        print(f'非股市新聞:內文({news["content"]})標題:({news["headline"]})')
+                        continue
+
+                    # 儲存到 Supabase
+                    supabase.table("stock_news").insert({
+                        "stockID": int(stock_id),
+                        "title": news["headline"],
+                        "date": news["date"],
+                        "content": news["content"],
+                        "source": "tvbs",
+                        "url": news["link"]
+                    }).execute()
+                    print(f"Saved news: {news['headline']} for stock ID: {stock_id} on date: {news['date']}")
+
+                except Exception as e:
+                    print(f"Error processing news for stock ID {stock_id}: {e}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1500)
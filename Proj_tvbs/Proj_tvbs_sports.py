@@ -152,7 +152,7 @@ def check_news_count(sport_id, news_date):
     except Exception as e:
         print(f"Error checking news count for {sport_id} on {news_date}: {e}")
         return 0
-def gemini_response(news, title):
+def gemini_response(news, title, sport_name):
     model = 'gemini-1.5-flash'
     temperature = 1
     top_p = 0.9
@@ -203,61 +203,69 @@ def gemini_response(news, title):
 
     return "運動類別的新聞"  # 如果新聞相關，返回相應的結果
 
-# 從 Supabase 中獲取所有運動類關鍵字的 sportID
-sports_response = supabase.table("sport").select("sportID").execute()
 
-# 確認是否拿到資料
-if not sports_response or not sports_response.data:
-    print(f"Error fetching sport IDs: {sports_response}")
-    exit()
+def main(pages=1500):
+    """
+    爬取 pages 頁的新聞並存到 Supabase，可在常駐的 worker 中重複呼叫
+    """
+    # 從 Supabase 中獲取所有運動類關鍵字的 sportID
+    sports_response = supabase.table("sport").select("sportID").execute()
 
-sport_ids = sports_response.data  # 獲取 sportID 資料
+    # 確認是否拿到資料
+    if not sports_response or not sports_response.data:
+        print(f"Error fetching sport IDs: {sports_response}")
+        return
 
+    sport_ids = sports_response.data  # 獲取 sportID 資料
 
-# 循環，控制總爬取頁數
-for current_page in range(1, 1501, 3):  # 每次迭代爬取3页
-    print(f'current page: {current_page}')
-    for sport in sport_ids:
-        sport_id = sport['sportID']
-        
-        # 使用 get_sport_name 函數獲取 sport_name
-        sport_name = get_sport_name(sport_id)
-        
-        if not sport_name:
-            print(f"Skipping sport ID {sport_id} due to missing sport name.")
-            continue
 
-        end_page = min(current_page + 2, 1500)  # 設定結束頁面為當前頁的3頁之後或1500
+    # 循環，控制總爬取頁數
+    for current_page in range(1, pages+1, 3):  # 每次迭代爬取3页
+        print(f'current page: {current_page}')
+        for sport in sport_ids:
+            sport_id = sport['sportID']
+
+            # 使用 get_sport_name 函數獲取 sport_name
+            sport_name = get_sport_name(sport_id)
+
+            if not sport_name:
+                print(f"Skipping sport ID {sport_id} due to missing sport name.")
+                continue
+
+            end_page = min(current_page + 2, pages)  # 設定結束頁面為當前頁的3頁之後或1500
+
+            # 爬取新聞（包括標題、連結、日期和內容）
+            news_list = fetch_news_tvbs(sport_id, sport_name, current_page, end_page)
+
+            for news in news_list:
+                try:
+                    news_date = news["date"]
+
+                    # 檢查該日期是否已儲存3則新聞
+                    if check_news_count(sport_id, news_date) >= 3:
+                        print(f"Already saved 3 news articles for {sport_id} on {news_date}. Skipping...")
+                        continue
+
+                    response = gemini_response(news["content"], news["headline"], sport_name)
+
+                    if response == "非運動類別的新聞":
+                        print(f'非運動類別的新聞:內文({news["content"]})標題:({news["headline"]})')
+                        continue
+
+                    # 儲存到 Supabase
+                    supabase.table("sport_news").insert({
+                        "sportID": int(sport_id),
+                        "title": news["headline"],
+                        "date": news["date"],
+                        "content": news["content"],
+                        "source": "tvbs",
+                        "url": news["link"]
+                    }).execute()
+                    print(f"Saved news: {news['headline']} for sport ID: {sport_id} on date: {news['date']}")
+
+                except Exception as e:
+                    print(f"Error processing news for sport ID {sport_id}: {e}")  
 
-        # 爬取新聞（包括標題、連結、日期和內容）
-        news_list = fetch_news_tvbs(sport_id, sport_name, current_page, end_page)
-        
-        for news in news_list:
-            try:
-                news_date = news["date"]
-                
-                # 檢查該日期是否已儲存3則新聞
-                if check_news_count(sport_id, news_date) >= 3:
-                    print(f"Already saved 3 news articles for {sport_id} on {news_date}. Skipping...")
-                    continue
-                
-                response = gemini_response(news["content"], news["headline"])
-                
-                if response == "非運動類別的新聞":
-                    print(f'非運動類別的新聞:內文({news["content"]})標題:({news["headline"]})')
-                    continue
-                
-                # 儲存到 Supabase
-                supabase.table("sport_news").insert({
-                    "sportID": int(sport_id),
-                    "title": news["headline"],
-                    "date": news["date"],
-                    "content": news["content"],
-                    "source": "tvbs",
-                    "url": news["link"]
-                }).execute()
-                print(f"Saved news: {news['headline']} for sport ID: {sport_id} on date: {news['date']}")
-                
-            except Exception as e:
-                print(f"Error processing news for sport ID {sport_id}: {e}")  
 
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1500)
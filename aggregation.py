@@ -0,0 +1,185 @@
+# aggregation.py
+# 情緒統計的資料結構，每次請求各自建立，不使用模組層級的全域變數
+# pandas 只有 DataFrame 輸入和時間序列用到，在函數中才載入 (見 utils.py)
+import os
+import numpy as np
+
+# ANALYZE_DEBUG=1 時才逐筆列印每個 ID 的情緒和星級，大量資料時 print 會佔掉大部分時間
+DEBUG_ROWS = os.getenv("ANALYZE_DEBUG") == "1"
+
+# emotion 數值對應的名稱 (1: positive, 0: neutral, -1: negative)
+EMOTION_LABELS = {1: "positive", 0: "neutral", -1: "negative"}
+
+
+class SentimentAggregate:
+    """一次分析結果的情緒分布和星級分布"""
+
+    def __init__(self, emotion_counts=None, star_counts=None):
+        self.emotion_counts = {"positive": 0, "neutral": 0, "negative": 0}
+        self.star_counts = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
+        if emotion_counts:
+            self.emotion_counts.update(emotion_counts)
+        if star_counts:
+            self.star_counts.update(star_counts)
+
+    def add(self, star, emotion):
+        """累計一筆情緒資料"""
+        self.star_counts[star] += 1
+        if emotion in EMOTION_LABELS:
+            self.emotion_counts[EMOTION_LABELS[emotion]] += 1
+
+    def merge(self, other):
+        """把另一個 SentimentAggregate 的計數加進來"""
+        for label, count in other.emotion_counts.items():
+            self.emotion_counts[label] += count
+        for star, count in other.star_counts.items():
+            self.star_counts[star] += count
+        return self
+
+    @property
+    def total(self):
+        return sum(self.star_counts.values())
+
+    def to_dict(self):
+        return {
+            "emotion_counts": dict(self.emotion_counts),
+            "star_counts": {str(star): count for star, count in self.star_counts.items()},
+        }
+
+
+def count_values(values, low, high):
+    """
+    以 bincount 計算 low..high 之間每個整數出現的次數，範圍外的值不計
+    values: int8 numpy array
+
+    return: 長度 high - low + 1 的 numpy array
+    """
+    values = values[(values >= low) & (values <= high)].astype(np.intp)
+    return np.bincount(values - low, minlength=high - low + 1)
+
+
+def aggregate_arrays(stars, emotions):
+    """
+    由 star 和 emotion 兩個 int8 欄位計算分布
+
+    return: SentimentAggregate
+    """
+    star_bins = count_values(stars, 1, 5)
+    emotion_bins = count_values(emotions, -1, 1)  # index 0: -1, 1: 0, 2: 1
+    return SentimentAggregate(
+        emotion_counts={
+            "positive": int(emotion_bins[2]),
+            "neutral": int(emotion_bins[1]),
+            "negative": int(emotion_bins[0]),
+        },
+        star_counts={star: int(star_bins[star - 1]) for star in range(1, 6)},
+    )
+
+
+def int8_column(sentiment_data, column, missing):
+    """
+    取出一個欄位轉成 int8 numpy array
+    缺少的值 (None) 轉成有效範圍外的 missing，就不會被計算
+    """
+    if not isinstance(sentiment_data, list):
+        # DataFrame (list 輸入不需要載入 pandas)
+        return sentiment_data[column].fillna(missing).to_numpy(dtype=np.int8)
+    # list of dict 直接逐欄讀取，不另外建立 DataFrame
+    return np.fromiter(
+        (missing if entry.get(column) is None else entry[column] for entry in sentiment_data),
+        dtype=np.int8,
+        count=len(sentiment_data),
+    )
+
+
+def aggregate_sentiments(sentiment_data, debug=None):
+    """
+    計算情緒資料的分布
+    sentiment_data: fetch_sentiment_data 回傳的 list of dict，或含 star、emotion 欄位的 DataFrame
+    debug: 是否逐筆列印每個 ID 的情緒和星級，預設依 ANALYZE_DEBUG 環境變數
+
+    return: SentimentAggregate
+    """
+    if debug is None:
+        debug = DEBUG_ROWS
+
+    if debug:
+        import pandas as pd
+
+        # 列印每筆資料的來源資料庫、ID、star 和 emotion
+        frame = pd.DataFrame(sentiment_data, columns=["db_index", "news_id", "star", "emotion"])
+        for entry in frame.itertuples(index=False):
+            print(
+                f"Database: {entry.db_index}, News ID: {entry.news_id}, Star: {entry.star}, Emotion: {entry.emotion}"
+            )
+
+    # emotion 為 0 (neutral) 是有效值，所以缺少的 emotion 用 -128 區分
+    return aggregate_arrays(
+        int8_column(sentiment_data, "star", 0), int8_column(sentiment_data, "emotion", -128)
+    )
+
+
+# 時間序列的解析度：pandas period 頻率，以及滾動平均使用的期數
+RESOLUTIONS = {"day": "D", "week": "W", "month": "M"}
+ROLLING_WINDOWS = {"day": 7, "week": 4, "month": 3}
+
+
+def choose_resolution(start_date, end_date):
+    """依日期範圍長度自動選擇解析度，讓圖上的點數維持在一兩百個以內"""
+    import pandas as pd
+
+    days = (pd.Timestamp(end_date) - pd.Timestamp(start_date)).days + 1
+    if days <= 92:
+        return "day"
+    if days <= 730:
+        return "week"
+    return "month"
+
+
+def resample_daily(daily_stats, resolution, start_date, end_date):
+    """
+    把每日平均 sentiment 重新取樣成 day / week / month
+    daily_stats: index 為日期，欄位 mean、count (見 AnalysisContext.daily_stats)
+    resolution: "day"、"week"、"month" 或 "auto"
+
+    平均以文章數加權，沒有文章的期間 mean 為 NaN、count 為 0；
+    rolling_mean 為最近 ROLLING_WINDOWS[resolution] 期的加權平均
+
+    return: (resolution, DataFrame)，index 為每期的開始日期，欄位 mean、count、rolling_mean
+    """
+    import pandas as pd
+
+    if resolution == "auto":
+        resolution = choose_resolution(start_date, end_date)
+    freq = RESOLUTIONS[resolution]
+
+    periods = pd.period_range(pd.Timestamp(start_date), pd.Timestamp(end_date), freq=freq)
+    if daily_stats.empty:
+        # 範圍內沒有任何文章：空的合併結果中 mean 是 object dtype，直接以 0 填滿每一期
+        totals = pd.DataFrame({"total": 0.0, "count": 0}, index=periods)
+    else:
+        counts = daily_stats["count"].to_numpy(dtype=np.int64)
+        totals = (
+            pd.DataFrame(
+                {"total": daily_stats["mean"].to_numpy(dtype=float) * counts, "count": counts},
+                index=pd.DatetimeIndex(daily_stats.index).to_period(freq),
+            )
+            .groupby(level=0)
+            .sum()
+            .reindex(periods, fill_value=0)
+        )
+
+    window = ROLLING_WINDOWS[resolution]
+    rolling = totals.rolling(window, min_periods=1).sum()
+
+    counts = totals["count"].to_numpy(dtype=np.int64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.where(counts > 0, totals["total"].to_numpy(dtype=float) / counts, np.nan)
+        rolling_means = np.where(
+            rolling["count"] > 0, rolling["total"] / rolling["count"], np.nan
+        )
+
+    return resolution, pd.DataFrame(
+        {"mean": means, "count": counts, "rolling_mean": rolling_means},
+        index=pd.DatetimeIndex(periods.start_time, name="date"),
+    )
@@ -1,16 +1,24 @@
-from flask import Flask, request, jsonify, render_template
-import subprocess
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context
+import json
 import os
 import logging
 from utils import (
+    AnalysisContext,
     analyze_data,
     analyze_realtime,
+    analysis_to_dict,
+    analyze_in_shards,
     plot_statistics,
     plot_sentiment_timeseries,
 )
 from datetime import datetime
+from news_search import search_news, search_news_page, stream_news, InvalidCursor
+from cache import news_search_cache, news_search_key, invalidate_topic, chart_cache, chart_key, topic_version
+import rollup
+from crawl_jobs import CrawlJobManager, MAX_WORKERS
+from crawl_workers import CrawlWorkerPool
+from db import get_clients
 
-from supabase import create_client
 from dotenv import load_dotenv
 
 
@@ -21,18 +29,19 @@ print(f"Current file path: {current_file_path}")
 # Load environment variables
 load_dotenv()
 
-# Supabase info for Database 1
-url1 = os.getenv("SUPABASE_URL_1")
-key1 = os.getenv("SUPABASE_KEY_1")
-supabase1 = create_client(url1, key1)
-
-# Supabase info for Database 2
-url2 = os.getenv("SUPABASE_URL_2")
-key2 = os.getenv("SUPABASE_KEY_2")
-supabase2 = create_client(url2, key2)
+# 兩個資料庫的 Supabase client 由 db.get_clients() 建立，app、utils 和情緒分析共用
 
 app = Flask(__name__)
 
+# 爬蟲在常駐的 worker 中執行，CRAWL_WARM_WORKERS=0 時改回每個工作啟動一個新的 Python 程序
+crawl_worker_pool = (
+    CrawlWorkerPool(MAX_WORKERS) if os.getenv("CRAWL_WARM_WORKERS", "1") == "1" else None
+)
+# 爬蟲可能已寫入部分新聞，工作結束後不論成功與否都讓該 topic 的搜尋快取失效
+crawl_job_manager = CrawlJobManager(
+    on_finish=lambda job: invalidate_topic(job.topic), pool=crawl_worker_pool
+)
+
 
 @app.route("/about.html")
 def about():
@@ -71,38 +80,37 @@ def fetch_news():
     topic = data.get('topic')
     pages = data.get('pages')
 
-    # 確定執行的腳本名稱
-    script_map = {
-        ("chinatimes", "stock"): "Proj_ChinaTimes/Proj_ChinaTimes_Stock.py",
-        ("chinatimes", "health"): "Proj_ChinaTimes/Proj_ChinaTimes_health.py",
-        ("chinatimes", "sports"): "Proj_ChinaTimes/Proj_ChinaTimes_sports.py",
-        ("liberty", "stock"): "Proj_ltn/Proj_ltn_Stock.py",
-        ("liberty", "health"): "Proj_ltn/Proj_ltn_health.py",
-        ("liberty", "sports"): "Proj_ltn/Proj_ltn_sports.py",
-        ("tvbs", "stock"): "Proj_tvbs/Proj_tvbs_Stock.py",
-        ("tvbs", "health"): "Proj_tvbs/Proj_tvbs_health.py",
-        ("tvbs", "sports"): "Proj_tvbs/Proj_tvbs_sports.py",
-        ("api", "stock"): "Proj_API/stock_API_news.py",
-        ("api", "health"): "Proj_API/health_API_news.py",
-        ("api", "sports"): "Proj_API/sport_API_news.py"
-    }
-    
-    script_name = script_map.get((company, topic))
-    
-    if script_name is None:
+    # 爬蟲在背景執行，立即回傳工作 id，之後以 /crawl_jobs/<job_id> 查詢進度
+    try:
+        job = crawl_job_manager.submit(company, topic, pages)
+    except KeyError:
         return jsonify({"message": "Invalid company or topic"}), 400
+    except ValueError:
+        return jsonify({"message": "pages must be a positive integer"}), 400
 
-    try:
-        # 呼叫對應的 Python 檔案，並傳遞頁數參數
-        result = subprocess.run(['python', script_name, str(pages)], capture_output=True, text=True)
-        
-        # 檢查腳本執行狀態
-        if result.returncode == 0:
-            return jsonify({"message": "success"})
-        else:
-            return jsonify({"message": "Error executing script", "details": result.stderr}), 500
-    except Exception as e:
-        return jsonify({"message": f"Server error: {str(e)}"}), 500
+    return jsonify({"message": "queued", "job_id": job.id}), 202
+
+
+@app.route("/crawl_jobs", methods=["GET"])
+def list_crawl_jobs():
+    return jsonify({"jobs": crawl_job_manager.list()})
+
+
+@app.route("/crawl_jobs/<job_id>", methods=["GET"])
+def crawl_job_status(job_id):
+    # 回傳工作狀態和進度 (已完成頁數、已儲存文章數)
+    job = crawl_job_manager.get(job_id)
+    if job is None:
+        return jsonify({"message": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route("/crawl_jobs/<job_id>/cancel", methods=["POST"])
+def cancel_crawl_job(job_id):
+    job = crawl_job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({"message": "Job not found"}), 404
+    return jsonify(job.to_dict())
 
 
 @app.route("/analyze", methods=["POST"])
@@ -112,51 +120,152 @@ def analyze():
     startDate = request.form.get("startDate")
     endDate = request.form.get("endDate")
     source = request.form.get("source")
+    # "png" 由伺服器繪製圖表，"json" 只回傳統計數列由瀏覽器繪製
+    output_format = request.form.get("format", "png")
+    # 時間序列的解析度，"auto" 依日期範圍長度選擇 day / week / month
+    resolution = request.form.get("resolution", "auto")
 
     # Debugging statements
     print(
         f" Mode:{mode},Topic: {topic}, Start Date: {startDate}, End Date: {endDate}, Source: {source}"
     )
 
+    if output_format not in ["png", "json"]:
+        return jsonify({"error": "Invalid format. Use png or json."}), 400
+    error = validate_analyze_args(topic, startDate, endDate, source, resolution)
+    if error:
+        return jsonify({"error": error}), 400
+
+    # 這次請求的新聞和情緒資料只抓取一次，統計和兩張圖表共用
+    # 統計結果都是區域變數，多個執行緒同時處理 /analyze 也不會互相影響
+    # 資料庫模式在已建立每日彙總表時直接讀取彙總表 (見 rollup.py)
+    context = AnalysisContext(topic, startDate, endDate, source, use_rollup=(mode == "database"))
+
+    # 資料庫查詢失敗時回傳錯誤，而不是把失敗當成沒有資料畫出空白圖表
+    # postgrest (連帶 httpx) 在第一次分析時才載入，不拖慢 app 啟動
+    from postgrest.exceptions import APIError
+
+    try:
+        if mode == "database":
+            aggregate = None  # 圖表快取沒有命中時才讀取資料
+        else:  # "realtime" 即時分析模式，先分析並寫入新的情緒
+            aggregate = analyze_realtime(topic, startDate, endDate, source, context)
+
+        # 資料沒有改變時直接使用快取的結果，不重新讀取和繪製
+        key = chart_key(
+            mode, topic, startDate, endDate, source, analysis_data_version(topic), output_format, resolution
+        )
+        result = chart_cache.get(key)
+        if result is None:
+            if aggregate is None:
+                # 從資料庫取得已儲存的分析數據
+                aggregate = analyze_data(topic, startDate, endDate, source, context)
+
+            if output_format == "json":
+                # 情緒分布、評分分布和每日平均，由 emotion.html 以 Chart.js 繪製
+                result = analysis_to_dict(
+                    aggregate, context.daily_stats, startDate, endDate, resolution
+                )
+            else:
+                result = {
+                    # 繪製情緒分布和評分分布圖表
+                    "chart": plot_statistics(aggregate),
+                    # 繪製情緒隨時間變化的時間序列圖
+                    "time_series": plot_sentiment_timeseries(
+                        topic, startDate, endDate, source, context, resolution
+                    ),
+                }
+            chart_cache.set(key, result)
+    except APIError as e:
+        print(f"Database query failed: {e}")
+        return jsonify({"error": f"Database query failed: {e}"}), 502
+
+    return jsonify(result)
+
+
+def validate_analyze_args(topic, startDate, endDate, source, resolution):
+    """檢查 /analyze 和 /analyze_stream 共用的參數，有錯誤時回傳錯誤訊息"""
     # Validate topic selection and date format
     if topic not in ["health", "sport", "stock"]:
-        return jsonify({"error": "Invalid topic selected."}), 400
+        return "Invalid topic selected."
     if source not in ["ltn", "tvbs", "China Times", "Yahoo Entertainment", "all"]:
-        return jsonify({"error": "Invalid topic selected."}), 400
+        return "Invalid topic selected."
+    if resolution not in ["auto", "day", "week", "month"]:
+        return "Invalid resolution. Use auto, day, week or month."
 
     # 檢查日期格式
     try:
-        datetime.strptime(startDate, "%Y-%m-%d")
-        datetime.strptime(endDate, "%Y-%m-%d")
+        datetime.strptime(startDate or "", "%Y-%m-%d")
+        datetime.strptime(endDate or "", "%Y-%m-%d")
     except ValueError as ve:
-        return (
-            jsonify(
-                {"error": f"Invalid date format. Use YYYY-MM-DD. Error: {str(ve)}"}
-            ),
-            400,
-        )
-    global global_plot_data
-    global_plot_data = {}  # Reset the global data structure
-
-    if mode == "database":
-        # 從資料庫取得已儲存的分析數據
-        analyze_data(topic, startDate, endDate, source)
-
-        # 繪製情緒分布和評分分布圖表
-        chart_image = plot_statistics()
-
-        # 繪製情緒隨時間變化的時間序列圖
-        time_series_image = plot_sentiment_timeseries(topic, startDate, endDate, source)
-    else:  # "realtime" 即時分析模式
-        analyze_realtime(topic, startDate, endDate, source)
-
-        # 繪製情緒分布和評分分布圖表
-        chart_image = plot_statistics()
-
-        # 繪製情緒隨時間變化的時間序列圖
-        time_series_image = plot_sentiment_timeseries(topic, startDate, endDate, source)
+        return f"Invalid date format. Use YYYY-MM-DD. Error: {str(ve)}"
+    return None
+
+
+@app.route("/analyze_stream", methods=["GET"])
+def analyze_stream():
+    """
+    資料庫模式的漸進式分析：依月份分段同時處理，每完成一個月份就送出一個 SSE 事件
+    事件 "progress" 和最後的 "done" 的內容與 /analyze 的 JSON 格式相同，另外加上 shards_done、shards_total
+    失敗時送出 "analysis_error" 事件 (避免和 EventSource 本身的 error 事件混淆)
+    瀏覽器關閉連線時停止還沒開始的月份
+    """
+    topic = request.args.get("topic")
+    startDate = request.args.get("startDate")
+    endDate = request.args.get("endDate")
+    source = request.args.get("source")
+    resolution = request.args.get("resolution", "auto")
+
+    error = validate_analyze_args(topic, startDate, endDate, source, resolution)
+    if error:
+        return jsonify({"error": error}), 400
+
+    key = chart_key(
+        "database", topic, startDate, endDate, source, analysis_data_version(topic), "json", resolution
+    )
 
-    return jsonify({"chart": chart_image, "time_series": time_series_image})
+    def event(name, data):
+        return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    def generate():
+        from postgrest.exceptions import APIError
+
+        # 與 /analyze 的 JSON 格式共用圖表快取，命中時直接送出完整結果
+        result = chart_cache.get(key)
+        if result is not None:
+            yield event("done", {**result, "shards_done": 1, "shards_total": 1})
+            return
+
+        shards = analyze_in_shards(topic, startDate, endDate, source)
+        try:
+            for done, total, aggregate, daily_stats in shards:
+                result = analysis_to_dict(aggregate, daily_stats, startDate, endDate, resolution)
+                progress = {**result, "shards_done": done, "shards_total": total}
+                yield event("done" if done == total else "progress", progress)
+        except APIError as e:
+            print(f"Database query failed: {e}")
+            yield event("analysis_error", {"error": f"Database query failed: {e}"})
+            return
+        finally:
+            # 連線中斷時 (GeneratorExit) 也會關閉 generator，取消還沒開始的月份
+            shards.close()
+
+        # 所有月份都完成後才寫入快取
+        chart_cache.set(key, result)
+
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    # 避免反向代理緩衝整個回應
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+def analysis_data_version(topic):
+    """
+    圖表快取 key 中的資料版本：彙總表的版本 (任何程序寫入情緒都會更新)，
+    加上這個程序中爬蟲完成或寫入情緒的次數
+    """
+    return (rollup.data_version(topic), topic_version(topic))
 
 
 @app.route("/fetch_news_data", methods=["POST"])
@@ -172,83 +281,93 @@ def fetch_news_data():
         {"新聞來源": source, "主題": topic, "日期": date, "情緒": emotion},
     )
 
-    # 定義所有可能的 topic
-    topics = ["health", "stock", "sport"] if topic is None else [topic]
-    results = []
-    seen_entries = set()
+    # 相同的過濾條件直接使用快取的結果
+    cache_key = news_search_key(topic, source, date, emotion)
+    results = news_search_cache.get(cache_key)
+    if results is not None:
+        return jsonify(results=results, message="success", incomplete=[])
+
+    # 同時查詢兩個資料庫的所有 topic，並合併去除重複的結果
+    results, incomplete = search_news(get_clients(), topic, source, date, emotion)
 
-    # 將情緒字串轉換成數值
-    emotion_value = {"positive": 1, "neutral": 0, "negative": -1}.get(emotion)
+    # 只快取完整的結果，逾時或失敗的部分結果不快取
+    if results and not incomplete:
+        news_search_cache.set(cache_key, results)
 
-    for index, supabase_instance in enumerate([supabase1, supabase2], start=1):
-        for topic_item in topics:
-            for table_suffix in ["news"]:
-                table_name = f"{topic_item}_{table_suffix}"
+    # 返回結果或 "No data found" 信息
+    if results:
+        return jsonify(results=results, message="success", incomplete=incomplete)
+    else:
+        return jsonify(message="No data found.")
 
-                # 跳過與指定 topic 不符合的表格
-                if topic and not table_name.startswith(topic):
-                    continue
 
-                # 查詢新聞資料
-                query = supabase_instance.table(table_name).select(
-                    "title, date, content, source, url, id"
-                )
+@app.route("/fetch_news_data/page", methods=["POST"])
+def fetch_news_data_page():
+    data = request.json
+    topic = data.get("topic")
+    source = data.get("company")
+    date = data.get("date")
+    emotion = data.get("emotion")
 
-                # 應用新聞來源和日期的過濾條件
-                if source:
-                    query = query.eq("source", source)
-                if date:
-                    query = query.eq("date", date)
-
-                # 執行查詢並獲取數據
-                data = query.execute().data or []
-
-                for item in data:
-                    if item["id"] is None:
-                        continue  # 跳過 id 為 None 的項目
-
-                    # 避免重複項目
-                    unique_key = (item["date"], item["title"], item["source"])
-                    if unique_key in seen_entries:
-                        continue
-
-                    # 獲取情緒資料
-                    sentiment_table = f"{topic_item}_news_sentiment"
-                    emotion_query = (
-                        supabase_instance.table(sentiment_table)
-                        .select("emotion")
-                        .eq("news_id", item["id"])
-                    )
-
-                    # 只在 emotion_value 有效的情況下加入條件
-                    if emotion_value is not None:
-                        emotion_query = emotion_query.eq("emotion", emotion_value)
-
-                    # 執行情緒查詢
-                    emotion_data = emotion_query.execute().data
-
-                    # 如果查詢到情緒資料，將其添加到 item 中
-                    if emotion_data:
-                        item["emotion"] = emotion_data[0]["emotion"]
-                    else:
-                        # 如果情緒為 "all"，仍然保留該條目，但情緒設為 None
-                        if emotion == "all":
-                            item["emotion"] = None
-                        else:
-                            continue  # 若不是 "all" 且沒有符合條件的情緒，跳過該新聞
-
-                    # 添加到結果中並標記該項目
-                    seen_entries.add(unique_key)
-                    item["topic"] = topic_item
-                    results.append(item)
+    # 依 (資料庫, topic, id) 分頁，下一頁請帶上回傳的 next_cursor
+    try:
+        results, next_cursor = search_news_page(
+            get_clients(),
+            topic,
+            source,
+            date,
+            emotion,
+            cursor=data.get("cursor"),
+            limit=data.get("limit"),
+        )
+    except (InvalidCursor, TypeError, ValueError) as e:
+        return jsonify({"message": str(e)}), 400
 
-    # 返回結果或 "No data found" 信息
     if results:
-        return jsonify(results=results, message="success")
+        return jsonify(results=results, next_cursor=next_cursor, message="success")
     else:
-        return jsonify(message="No data found.")
+        return jsonify(next_cursor=None, message="No data found.")
+
+
+@app.route("/fetch_news_data/stream", methods=["POST"])
+def fetch_news_data_stream():
+    data = request.json
+    topic = data.get("topic")
+    source = data.get("company")
+    date = data.get("date")
+    emotion = data.get("emotion")
+
+    # 以 NDJSON 串流回傳，每一行是一筆新聞，最後一行是 {"done": true, "count": n, "incomplete": [...]}
+    # incomplete 為逾時或失敗而略過的 "DB{index}:{topic}" (與 /fetch_news_data 相同)
+    cache_key = news_search_key(topic, source, date, emotion)
+
+    def generate():
+        cached = news_search_cache.get(cache_key)
+        incomplete = []
+        if cached is not None:
+            rows = cached
+        else:
+            rows = stream_news(get_clients(), topic, source, date, emotion, incomplete=incomplete)
+
+        items = []
+        for item in rows:
+            items.append(item)
+            yield json.dumps(item, ensure_ascii=False) + "\n"
+
+        # 完整串流結束後才寫入快取，逾時或失敗的部分結果不快取
+        if cached is None and items and not incomplete:
+            news_search_cache.set(cache_key, items)
+        yield json.dumps({"done": True, "count": len(items), "incomplete": incomplete}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+@app.route("/cache_stats", methods=["GET"])
+def cache_stats():
+    # 快取命中率等統計，用來調整快取大小
+    return jsonify({"news_search": news_search_cache.stats(), "charts": chart_cache.stats()})
 
 
 if __name__ == "__main__":
     # 定義app在8080埠運行
-    app.run(host="0.0.0.0", port=8000, debug=True)
+    app.run(host="0.0.0.0", port=8000, debug=True, threaded=True)
@@ -0,0 +1,108 @@
+# benchmarks/bench_aggregation.py
+# 比較逐筆迴圈 (每筆 print) 和 numpy bincount 兩種情緒統計方式的速度
+# 使用 CSV資料庫 中的 {topic}_news_sentiment 資料
+#
+# python benchmarks/bench_aggregation.py [--csv CSV資料庫/DB1/stock_news_sentiment.csv] [--repeat 5]
+import os
+import sys
+import csv
+import time
+import argparse
+import contextlib
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from aggregation import aggregate_sentiments  # noqa: E402
+
+
+def load_sentiments(path, db_index=1):
+    """把 CSV 讀成與 fetch_sentiment_data 相同格式的 list of dict"""
+    rows = []
+    with open(path, encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            rows.append(
+                {
+                    "news_id": int(row["news_id"]),
+                    "sentiment": float(row["sentiment"]),
+                    "emotion": int(row["emotion"]),
+                    "star": int(row["star"]),
+                    "db_index": db_index,
+                }
+            )
+    return rows
+
+
+def loop_aggregate(sentiment_data, out=None):
+    """原本 analyze_data 的逐筆迴圈，out 為 None 時不 print"""
+    emotion_counts = {"positive": 0, "neutral": 0, "negative": 0}
+    star_counts = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
+    for entry in sentiment_data:
+        db_index = entry["db_index"]
+        news_id = entry["news_id"]
+        star = entry["star"]
+        emotion = entry["emotion"]
+
+        if out is not None:
+            print(
+                f"Database: {db_index}, News ID: {news_id}, Star: {star}, Emotion: {emotion}",
+                file=out,
+            )
+
+        star_counts[star] += 1
+        if emotion == 1:
+            emotion_counts["positive"] += 1
+        elif emotion == 0:
+            emotion_counts["neutral"] += 1
+        elif emotion == -1:
+            emotion_counts["negative"] += 1
+    return emotion_counts, star_counts
+
+
+def best_of(repeat, func, *args):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--csv",
+        default=os.path.join(ROOT_DIR, "CSV資料庫", "DB1", "stock_news_sentiment.csv"),
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--stdout",
+        action="store_true",
+        help="逐筆迴圈的 print 輸出到 stdout (與伺服器實際情況相同)，預設輸出到 os.devnull",
+    )
+    args = parser.parse_args()
+
+    rows = load_sentiments(args.csv)
+    print(f"{len(rows)} sentiment rows from {args.csv}")
+
+    with contextlib.ExitStack() as stack:
+        out = sys.stdout if args.stdout else stack.enter_context(open(os.devnull, "w"))
+        loop_time, (emotion_counts, star_counts) = best_of(args.repeat, loop_aggregate, rows, out)
+    loop_quiet_time, _ = best_of(args.repeat, loop_aggregate, rows)
+    vector_time, aggregate = best_of(args.repeat, aggregate_sentiments, rows, False)
+
+    assert aggregate.emotion_counts == emotion_counts
+    assert aggregate.star_counts == star_counts
+
+    print(f"{'method':<32}{'best (ms)':>12}{'rows/s':>14}")
+    for name, seconds in [
+        ("loop + print", loop_time),
+        ("loop without print", loop_quiet_time),
+        ("vectorized (bincount)", vector_time),
+    ]:
+        print(f"{name:<32}{seconds * 1000:>12.2f}{len(rows) / seconds:>14,.0f}")
+    print(f"speedup vs loop + print: {loop_time / vector_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
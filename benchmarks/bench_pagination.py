@@ -0,0 +1,112 @@
+# benchmarks/bench_pagination.py
+# 比較 OFFSET 分頁 (.range(offset, offset + n - 1)) 和 keyset 分頁 (id > last_id ORDER BY id LIMIT n)
+# 以記憶體中的 SQLite 代替 Supabase，資料來自 CSV資料庫 的 {topic}_news.csv
+# 為了模擬多年份的資料量，會把 CSV 的資料複製 --copies 份 (id 往後平移)
+#
+# python benchmarks/bench_pagination.py [--copies 20] [--batch-size 1000]
+import os
+import csv
+import time
+import sqlite3
+import argparse
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+csv.field_size_limit(1 << 30)
+
+
+def seed(conn, path, copies):
+    """建立 news 資料表，回傳 (筆數, 最早日期, 最晚日期)"""
+    conn.execute(
+        "CREATE TABLE news (id INTEGER PRIMARY KEY, title TEXT, date TEXT, content TEXT, source TEXT, url TEXT)"
+    )
+    conn.execute("CREATE INDEX news_date ON news (date)")
+
+    with open(path, encoding="utf-8") as f:
+        rows = [row for row in csv.DictReader(f) if row["date"]]
+
+    max_id = max(int(row["id"]) for row in rows)
+
+    for copy in range(copies):
+        conn.executemany(
+            "INSERT INTO news VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    int(row["id"]) + copy * max_id,
+                    row["title"],
+                    row["date"],
+                    row["content"],
+                    row["source"],
+                    row["url"],
+                )
+                for row in rows
+            ),
+        )
+    conn.commit()
+    dates = [row["date"] for row in rows]
+    return len(rows) * copies, min(dates), max(dates)
+
+
+def offset_scan(conn, columns, start_date, end_date, batch_size):
+    """原本的寫法：每一頁都要先跳過前面 offset 筆"""
+    count, offset, pages = 0, 0, []
+    while True:
+        began = time.perf_counter()
+        data = conn.execute(
+            f"SELECT {columns} FROM news WHERE date >= ? AND date <= ? ORDER BY id LIMIT ? OFFSET ?",
+            (start_date, end_date, batch_size, offset),
+        ).fetchall()
+        pages.append(time.perf_counter() - began)
+        if not data:
+            break
+        count += len(data)
+        offset += batch_size
+    return count, pages
+
+
+def keyset_scan(conn, columns, start_date, end_date, batch_size):
+    """db.iter_keyset_pages 的寫法：從上一頁最後的 id 接著讀"""
+    count, after_id, pages = 0, -1, []
+    while True:
+        began = time.perf_counter()
+        data = conn.execute(
+            f"SELECT {columns} FROM news WHERE date >= ? AND date <= ? AND id > ? ORDER BY id LIMIT ?",
+            (start_date, end_date, after_id, batch_size),
+        ).fetchall()
+        pages.append(time.perf_counter() - began)
+        if not data:
+            break
+        count += len(data)
+        after_id = data[-1][0]
+    return count, pages
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--csv", default=os.path.join(ROOT_DIR, "CSV資料庫", "DB2", "stock_news.csv")
+    )
+    parser.add_argument("--copies", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(":memory:")
+    total, first_day, last_day = seed(conn, args.csv, args.copies)
+    print(f"{total} rows, {first_day} ~ {last_day}, batch size {args.batch_size}")
+
+    # fetch_news_ids 只選 id，fetch_data_within_date 選整列
+    print(f"{'query':<12}{'method':<10}{'rows':>10}{'pages':>8}{'total (ms)':>12}{'first page':>12}{'last page':>12}")
+    for label, columns in [("select id", "id"), ("select *", "*")]:
+        for name, scan in [("offset", offset_scan), ("keyset", keyset_scan)]:
+            began = time.perf_counter()
+            count, pages = scan(conn, columns, first_day, last_day, args.batch_size)
+            elapsed = time.perf_counter() - began
+            assert count == total
+            print(
+                f"{label:<12}{name:<10}{count:>10}{len(pages):>8}{elapsed * 1000:>12.1f}"
+                f"{pages[0] * 1000:>12.2f}{pages[-2] * 1000:>12.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# benchmarks/bench_prefetch.py
+# 比較依序 keyset 分頁和 count-first 平行分段讀取 (db.fetch_sharded) 的總時間
+# 以 FakeTable 模擬 PostgREST：每次查詢固定延遲 --latency 秒，單次回傳筆數上限 --max-rows
+# id 和日期取自 CSV資料庫 的 {topic}_news.csv，複製 --copies 份模擬兩年份的資料
+#
+# python benchmarks/bench_prefetch.py [--latency 0.05] [--copies 20]
+import os
+import sys
+import csv
+import time
+import bisect
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from db import fetch_sharded, iter_keyset_pages  # noqa: E402
+
+csv.field_size_limit(1 << 30)
+
+
+class FakeResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class FakeQuery:
+    """只支援 fetch_news_ids 用到的 select / gte / lte / gt / order / limit / execute"""
+
+    def __init__(self, table, latency, max_rows, count=None):
+        self.table = table
+        self.latency = latency
+        self.max_rows = max_rows
+        self.count = count
+        self.filters = []
+        self.desc = False
+        self.row_limit = None
+
+    def gte(self, column, value):
+        self.filters.append((column, ">=", value))
+        return self
+
+    def lte(self, column, value):
+        self.filters.append((column, "<=", value))
+        return self
+
+    def gt(self, column, value):
+        self.filters.append((column, ">", value))
+        return self
+
+    def order(self, column, desc=False):
+        self.desc = desc
+        return self
+
+    def limit(self, n):
+        self.row_limit = n
+        return self
+
+    def execute(self):
+        time.sleep(self.latency)
+
+        # id 條件以二分搜尋找出範圍 (相當於主鍵索引)，日期條件逐筆檢查
+        ids = self.table.ids
+        low, high = 0, len(ids)
+        date_checks = []
+        for column, op, value in self.filters:
+            if column == "date":
+                date_checks.append((op, value))
+            elif op == ">=":
+                low = max(low, bisect.bisect_left(ids, value))
+            elif op == ">":
+                low = max(low, bisect.bisect_right(ids, value))
+            else:
+                high = min(high, bisect.bisect_right(ids, value))
+
+        def matches(index):
+            day = self.table.dates[index]
+            return all(day >= value if op == ">=" else day <= value for op, value in date_checks)
+
+        indexes = range(high - 1, low - 1, -1) if self.desc else range(low, high)
+        count = sum(1 for i in indexes if matches(i)) if self.count else None
+
+        limit = min(self.row_limit or self.max_rows, self.max_rows)
+        rows = []
+        for i in indexes:
+            if len(rows) >= limit:
+                break
+            if matches(i):
+                rows.append({"id": ids[i]})
+        return FakeResponse(rows, count)
+
+
+class FakeTable:
+    def __init__(self, rows):
+        rows = sorted(rows)
+        self.ids = [row_id for row_id, _ in rows]
+        self.dates = [day for _, day in rows]
+
+
+def load_table(path, copies):
+    with open(path, encoding="utf-8") as f:
+        rows = [(int(row["id"]), row["date"]) for row in csv.DictReader(f) if row["date"]]
+    max_id = max(row_id for row_id, _ in rows)
+    return FakeTable((row_id + copy * max_id, day) for copy in range(copies) for row_id, day in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--csv", default=os.path.join(ROOT_DIR, "CSV資料庫", "DB2", "stock_news.csv")
+    )
+    parser.add_argument("--copies", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--max-rows", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    table = load_table(args.csv, args.copies)
+    start_date, end_date = min(table.dates), max(table.dates)
+
+    def build_query(count=None):
+        return (
+            FakeQuery(table, args.latency, args.max_rows, count)
+            .gte("date", start_date)
+            .lte("date", end_date)
+        )
+
+    print(f"{len(table.ids)} rows, latency {args.latency * 1000:.0f} ms, max-rows {args.max_rows}")
+
+    began = time.perf_counter()
+    sequential = [row["id"] for page in iter_keyset_pages(build_query, args.batch_size) for row in page]
+    baseline = time.perf_counter() - began
+    print(f"{'sequential keyset':<24}{baseline:>8.2f} s")
+
+    for workers in (1, 2, 4, 8, 16):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            began = time.perf_counter()
+            result = fetch_sharded(
+                {"news": build_query},
+                shard_size=args.batch_size,
+                batch_size=args.batch_size,
+                executor=executor,
+            )
+            elapsed = time.perf_counter() - began
+        assert [row["id"] for row in result["news"]] == sequential
+        print(f"{f'fetch_sharded x{workers}':<24}{elapsed:>8.2f} s{baseline / elapsed:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+# benchmarks/bench_sentiment_backends.py
+# 比較 sentiment/bert_model.py 各推論後端 (SENTIMENT_BACKEND: torch、int8、onnx) 的吞吐量 (articles/s)、
+# 單篇文章的延遲 (p50/p95)、記憶體 (RSS) 和結果
+# 文章取自 CSV資料庫 中已存有情緒結果的新聞 ({topic}_news_sentiment.news_id 對應 {topic}_news.id)，
+# 列出各後端的星級、情緒與第一個後端 (fp32 的 torch) 相同的比例，以及與資料庫中原本結果相同的比例
+# (原本的結果是以 text[:512] 逐篇計算，與目前以 token 截斷的輸入不完全相同，僅供參考)
+# 每個後端在各自的 Python 程序中執行，RSS 互不影響；模型可用 SENTIMENT_MODEL 環境變數指定本地目錄
+#
+# python benchmarks/bench_sentiment_backends.py [--backends torch,int8,onnx] [--limit 512] [--latency 32] [--threads 4]
+#     [--news CSV資料庫/DB2/stock_news.csv] [--sentiment CSV資料庫/DB2/stock_news_sentiment.csv]
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+csv.field_size_limit(1 << 30)
+
+CSV_DIR = os.path.join(ROOT_DIR, "CSV資料庫", "DB2")
+
+
+def load_rows(news_path, sentiment_path, limit):
+    """
+    以 news_id 合併新聞內容和已存的情緒結果，同一篇新聞只取第一筆
+
+    return: list of (content, star, emotion)
+    """
+    with open(news_path, encoding="utf-8") as f:
+        contents = {row["id"]: row["content"] for row in csv.DictReader(f) if row.get("content")}
+    rows, seen = [], set()
+    with open(sentiment_path, encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            news_id = row["news_id"]
+            if news_id in contents and news_id not in seen:
+                seen.add(news_id)
+                rows.append((contents[news_id], int(row["star"]), int(row["emotion"])))
+    return rows[:limit]
+
+
+def rss_mb():
+    """
+    目前程序的 RSS (MB)，只支援 Linux (/proc)，其他平台回傳 (None, None)
+    safetensors 的權重以 mmap 載入，計入 RSS 但屬於可回收的 page cache，所以另外列出匿名記憶體 (RssAnon)
+
+    return: (RSS, 匿名記憶體)
+    """
+    try:
+        with open("/proc/self/status") as f:
+            status = dict(line.split(":", 1) for line in f)
+    except OSError:
+        return None, None
+    return tuple(int(status[key].split()[0]) / 1024 for key in ("VmRSS", "RssAnon"))
+
+
+def peak_rss_mb():
+    """目前程序的 peak RSS (MB)，沒有 resource 模組 (Windows) 時回傳 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 的單位是 KB，macOS 是 bytes
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def worker(args):
+    """在子程序中以 SENTIMENT_BACKEND 指定的後端分析所有文章，結果以 JSON 印在最後一行"""
+    import torch
+
+    if args.threads:
+        # onnxruntime 的執行緒數在載入模型時讀取
+        os.environ["SENTIMENT_ONNX_THREADS"] = str(args.threads)
+    from sentiment.bert_model import load_model, analyze_batch
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    texts = [content for content, _, _ in load_rows(args.news, args.sentiment, args.limit)]
+
+    began = time.perf_counter()
+    load_model()
+    load_seconds = time.perf_counter() - began
+    # 暖機，排除第一次呼叫的初始化時間
+    analyze_batch(texts[:4], args.batch_size)
+
+    began = time.perf_counter()
+    results = analyze_batch(texts, args.batch_size)
+    elapsed = time.perf_counter() - began
+
+    # 單篇文章的延遲 (一篇一批，例如 API 即時分析一篇新聞)
+    latencies = []
+    for text in texts[: args.latency]:
+        began = time.perf_counter()
+        analyze_batch([text])
+        latencies.append((time.perf_counter() - began) * 1000)
+    rss, anon = rss_mb()
+
+    print(
+        json.dumps(
+            {
+                "stars": [result["star"] for result in results],
+                "emotions": [result["emotion"] for result in results],
+                "load_seconds": load_seconds,
+                "seconds": elapsed,
+                "p50_ms": percentile(latencies, 0.5) if latencies else None,
+                "p95_ms": percentile(latencies, 0.95) if latencies else None,
+                "rss_mb": rss,
+                "anon_mb": anon,
+                "peak_rss_mb": peak_rss_mb(),
+                "threads": torch.get_num_threads(),
+            }
+        )
+    )
+
+
+def run_backend(backend, args):
+    """在新的程序中執行 worker，失敗時 (例如沒有安裝 onnxruntime) 回傳 None"""
+    command = [
+        sys.executable, os.path.abspath(__file__), "--worker",
+        "--news", args.news, "--sentiment", args.sentiment, "--limit", str(args.limit),
+        "--latency", str(args.latency),
+    ]
+    if args.batch_size:
+        command += ["--batch-size", str(args.batch_size)]
+    if args.threads:
+        command += ["--threads", str(args.threads)]
+    result = subprocess.run(
+        command,
+        cwd=ROOT_DIR,
+        env={**os.environ, "SENTIMENT_BACKEND": backend},
+        stdout=subprocess.PIPE,
+        text=True,
+        encoding="utf-8",
+    )
+    if result.returncode != 0:
+        print(f"backend {backend} failed (exit code {result.returncode})", file=sys.stderr)
+        return None
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def format_number(value):
+    return "-" if value is None else f"{value:.0f}"
+
+
+def same_rate(values, reference):
+    return sum(v == r for v, r in zip(values, reference)) / len(reference)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--news", default=os.path.join(CSV_DIR, "stock_news.csv"))
+    parser.add_argument("--sentiment", default=os.path.join(CSV_DIR, "stock_news_sentiment.csv"))
+    parser.add_argument("--limit", type=int, default=512)
+    parser.add_argument("--backends", default="torch,int8,onnx", help="第一個後端作為比較的基準")
+    parser.add_argument("--latency", type=int, default=32, help="測量單篇延遲的文章數")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument(
+        "--threads", type=int, default=None, help="torch 和 onnxruntime 的執行緒數，預設由兩者各自決定"
+    )
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    rows = load_rows(args.news, args.sentiment, args.limit)
+    if not rows:
+        sys.exit(f"no stored sentiment matches an article in {args.news}")
+    stored_stars = [star for _, star, _ in rows]
+    stored_emotions = [emotion for _, _, emotion in rows]
+
+    reports = {backend: run_backend(backend, args) for backend in args.backends.split(",")}
+    backends = [backend for backend, report in reports.items() if report is not None]
+    if not backends:
+        sys.exit("all backends failed")
+    reference = reports[backends[0]]
+
+    print(f"{len(rows)} articles with stored sentiment from {args.sentiment}")
+    print(f"model {os.getenv('SENTIMENT_MODEL', 'default')}, torch threads {reference['threads']}")
+
+    # p50、p95: 單篇文章的延遲；RSS: 分析完成後的 RSS，anon: 其中的匿名記憶體 (不含 mmap 的模型檔)，peak: 包含載入過程的 RSS 最大值
+    # star、±1、emotion: 與第一個後端相同的比例 (±1: 星級差距不超過 1)；vs stored: 與資料庫中的結果相同的比例
+    print(
+        f"\n{'backend':<10}{'load s':>8}{'seconds':>10}{'articles/s':>12}{'speedup':>9}{'p50 ms':>8}{'p95 ms':>8}{'RSS MB':>8}{'anon':>7}{'peak':>7}"
+        f"{'star':>8}{'±1':>8}{'emotion':>9}{'stored star':>13}{'stored emotion':>16}"
+    )
+    for backend in backends:
+        report = reports[backend]
+        within_one = sum(
+            abs(s - r) <= 1 for s, r in zip(report["stars"], reference["stars"])
+        ) / len(rows)
+        print(
+            f"{backend:<10}{report['load_seconds']:>8.1f}{report['seconds']:>10.2f}"
+            f"{len(rows) / report['seconds']:>12.1f}{reference['seconds'] / report['seconds']:>8.1f}x"
+            f"{format_number(report['p50_ms']):>8}{format_number(report['p95_ms']):>8}"
+            f"{format_number(report['rss_mb']):>8}{format_number(report['anon_mb']):>7}"
+            f"{format_number(report['peak_rss_mb']):>7}"
+            f"{same_rate(report['stars'], reference['stars']):>8.1%}{within_one:>8.1%}"
+            f"{same_rate(report['emotions'], reference['emotions']):>9.1%}"
+            f"{same_rate(report['stars'], stored_stars):>13.1%}"
+            f"{same_rate(report['emotions'], stored_emotions):>16.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
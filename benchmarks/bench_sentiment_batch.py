@@ -0,0 +1,122 @@
+# benchmarks/bench_sentiment_batch.py
+# 比較逐篇呼叫 transformers pipeline (原本的 bert_sentiment_analysis) 和 sentiment/bert_model.analyze_batch 的吞吐量 (articles/s)
+# analyze_batch 分別以原本順序分批和依 token 長度排序後分批，並列出補齊的 [PAD] 佔實際 token 的比例
+# 另外統計以字元數截斷 (news[:512]) 時，有多少文章超過模型的 token 上限或沒有用滿
+# 文章取自 CSV資料庫 的 content 欄位，模型可用 SENTIMENT_MODEL 環境變數指定本地目錄
+#
+# python benchmarks/bench_sentiment_batch.py [--csv CSV資料庫/DB2/stock_news.csv] [--limit 256] [--batch-sizes 1,8,16,32]
+import os
+import sys
+import csv
+import time
+import argparse
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from sentiment.bert_model import (  # noqa: E402
+    load_model,
+    analyze_batch,
+    tokenize,
+    PaddingStats,
+    MAX_TOKENS,
+    MODEL_NAME,
+)
+
+csv.field_size_limit(1 << 30)
+
+# 原本以字元數截斷的長度
+OLD_CHARS = 512
+
+
+def load_articles(path, limit):
+    with open(path, encoding="utf-8") as f:
+        texts = [row["content"] for row in csv.DictReader(f) if row.get("content")]
+    return texts[:limit]
+
+
+def per_article(texts):
+    """原本的寫法：每篇文章各呼叫一次 pipeline"""
+    from transformers import pipeline
+
+    tokenizer, model = load_model()
+    sentiment_analyzer = pipeline("sentiment-analysis", model=model, tokenizer=tokenizer)
+    stars = []
+    for text in texts:
+        # 原本沒有 truncation，中文 512 個字元加上 [CLS]、[SEP] 會超過模型上限，這裡加上以免中斷
+        result = sentiment_analyzer(text[:OLD_CHARS], truncation=True, max_length=MAX_TOKENS)[0]
+        stars.append(int(result["label"].split()[0]))
+    return stars
+
+
+def truncation_report(texts):
+    """以字元數截斷時的 token 數：超過上限會被模型拒絕，不到上限但文章還有內容表示沒有用滿"""
+    tokenizer, _ = load_model()
+    char_lengths = [len(ids) for ids in tokenizer([text[:OLD_CHARS] for text in texts])["input_ids"]]
+    token_lengths = [len(ids) for ids in tokenize(texts)]
+    overflow = sum(length > MAX_TOKENS for length in char_lengths)
+    underused = sum(
+        length < MAX_TOKENS and len(text) > OLD_CHARS for length, text in zip(char_lengths, texts)
+    )
+    print(
+        f"text[:{OLD_CHARS}]: {overflow} articles over {MAX_TOKENS} tokens, "
+        f"{underused} cut before the token limit; "
+        f"token truncation: mean {sum(token_lengths) / len(texts):.0f} tokens vs "
+        f"{sum(min(length, MAX_TOKENS) for length in char_lengths) / len(texts):.0f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--csv", default=os.path.join(ROOT_DIR, "CSV資料庫", "DB2", "stock_news.csv")
+    )
+    parser.add_argument("--limit", type=int, default=256)
+    parser.add_argument("--batch-sizes", default="1,8,16,32")
+    parser.add_argument("--threads", type=int, default=None, help="torch.set_num_threads，預設由 torch 決定")
+    args = parser.parse_args()
+
+    import torch
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    texts = load_articles(args.csv, args.limit)
+    load_model()
+    # 暖機，排除第一次呼叫的初始化時間
+    analyze_batch(texts[:4])
+
+    print(f"{len(texts)} articles from {args.csv}")
+    print(f"model {MODEL_NAME}, torch threads {torch.get_num_threads()}")
+    truncation_report(texts)
+
+    began = time.perf_counter()
+    reference = per_article(texts)
+    baseline = time.perf_counter() - began
+
+    # same star: 與逐篇 text[:512] 的星級相同的比例，token 截斷會讓長文章多讀一些內容
+    print(
+        f"\n{'method':<32}{'seconds':>10}{'articles/s':>12}{'speedup':>10}{'padding':>10}{'same star':>12}"
+    )
+    print(
+        f"{'pipeline, one by one':<32}{baseline:>10.2f}{len(texts) / baseline:>12.1f}"
+        f"{1:>10.1f}x{'-':>10}{'-':>11}"
+    )
+
+    for batch_size in [int(size) for size in args.batch_sizes.split(",")]:
+        for label, sort_by_length in [("in order", False), ("by length", True)]:
+            if batch_size == 1 and sort_by_length:
+                continue  # 一篇一批沒有補齊
+            stats = PaddingStats()
+            began = time.perf_counter()
+            results = analyze_batch(texts, batch_size, sort_by_length, stats)
+            elapsed = time.perf_counter() - began
+            same = sum(result["star"] == star for result, star in zip(results, reference)) / len(texts)
+            print(
+                f"{f'analyze_batch x{batch_size} {label}':<32}{elapsed:>10.2f}{len(texts) / elapsed:>12.1f}"
+                f"{baseline / elapsed:>10.1f}x{stats.overhead:>10.1%}{same:>12.1%}"
+            )
+
+
+if __name__ == "__main__":
+    main()
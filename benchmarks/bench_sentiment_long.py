@@ -0,0 +1,132 @@
+# benchmarks/bench_sentiment_long.py
+# 比較長文章只算前 512 個 token (目前的做法) 和長文章模式 (重疊的 window，每篇最多 N 個) 的成本和結果
+# 沒有人工標註，以不限 window 數、整篇文章都計算的結果為基準，列出各設定的星級、情緒與基準相同的比例
+# 以及星級機率分布與基準的平均差距 (L1)；原本逐字元截斷 (text[:512]) 的結果也一起列出
+# 文章取自 CSV資料庫 的 content 欄位，只保留超過 --min-tokens 的文章，模型可用 SENTIMENT_MODEL 環境變數指定本地目錄
+#
+# python benchmarks/bench_sentiment_long.py [--csv CSV資料庫/DB2/stock_news.csv] [--min-tokens 512] [--max-windows 1,2,4,8] [--overlap 64]
+import os
+import sys
+import csv
+import time
+import argparse
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from sentiment import bert_model  # noqa: E402
+from sentiment.bert_model import (  # noqa: E402
+    load_model,
+    analyze_batch,
+    PaddingStats,
+    MAX_TOKENS,
+    MODEL_NAME,
+)
+
+csv.field_size_limit(1 << 30)
+
+# 原本以字元數截斷的長度
+OLD_CHARS = 512
+
+
+def load_long_articles(path, min_tokens, limit):
+    """只保留 token 數超過 min_tokens 的文章"""
+    with open(path, encoding="utf-8") as f:
+        texts = [row["content"] for row in csv.DictReader(f) if row.get("content")]
+    tokenizer, _ = load_model()
+    lengths = [len(ids) for ids in tokenizer(texts)["input_ids"]]
+    long_texts = [text for text, length in zip(texts, lengths) if length > min_tokens]
+    return long_texts[:limit], [length for length in lengths if length > min_tokens][:limit]
+
+
+def run(texts, batch_size, long_document, max_windows=None, overlap=None):
+    """
+    以指定的 window 上限和重疊執行一次
+
+    return: (results, 秒數, PaddingStats)
+    """
+    saved = bert_model.MAX_WINDOWS, bert_model.WINDOW_OVERLAP
+    if max_windows is not None:
+        bert_model.MAX_WINDOWS = max_windows
+    if overlap is not None:
+        bert_model.WINDOW_OVERLAP = overlap
+    try:
+        stats = PaddingStats()
+        began = time.perf_counter()
+        results = analyze_batch(texts, batch_size, stats=stats, long_document=long_document)
+        return results, time.perf_counter() - began, stats
+    finally:
+        bert_model.MAX_WINDOWS, bert_model.WINDOW_OVERLAP = saved
+
+
+def agreement(results, reference):
+    """星級相同、情緒相同的比例，以及星級機率分布的平均 L1 差距"""
+    count = len(reference)
+    same_star = sum(r["star"] == ref["star"] for r, ref in zip(results, reference)) / count
+    same_emotion = sum(r["emotion"] == ref["emotion"] for r, ref in zip(results, reference)) / count
+    distance = sum(
+        sum(abs(p - q) for p, q in zip(r["star_probs"], ref["star_probs"]))
+        for r, ref in zip(results, reference)
+    ) / count
+    return same_star, same_emotion, distance
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--csv", default=os.path.join(ROOT_DIR, "CSV資料庫", "DB2", "stock_news.csv")
+    )
+    parser.add_argument("--min-tokens", type=int, default=MAX_TOKENS)
+    parser.add_argument("--limit", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--max-windows", default="1,2,4,8")
+    parser.add_argument("--overlap", type=int, default=None, help="相鄰 window 重疊的 token 數，預設 SENTIMENT_WINDOW_OVERLAP")
+    parser.add_argument("--threads", type=int, default=None, help="torch.set_num_threads，預設由 torch 決定")
+    args = parser.parse_args()
+
+    import torch
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    load_model()
+    texts, lengths = load_long_articles(args.csv, args.min_tokens, args.limit)
+    if not texts:
+        sys.exit(f"no article longer than {args.min_tokens} tokens in {args.csv}")
+    # 暖機，排除第一次呼叫的初始化時間
+    analyze_batch(texts[:2], long_document=False)
+
+    print(f"{len(texts)} articles over {args.min_tokens} tokens from {args.csv}")
+    print(
+        f"tokens per article: mean {sum(lengths) / len(lengths):.0f}, max {max(lengths)}; "
+        f"model {MODEL_NAME}, torch threads {torch.get_num_threads()}"
+    )
+
+    # 基準：整篇文章都計算 (window 數不設上限)
+    reference, _, _ = run(texts, args.batch_size, True, max_windows=max(lengths), overlap=args.overlap)
+
+    rows = []
+    old_texts = [text[:OLD_CHARS] for text in texts]
+    rows.append((f"text[:{OLD_CHARS}] (chars)", *run(old_texts, args.batch_size, False)))
+    rows.append(("first 512 tokens", *run(texts, args.batch_size, False)))
+    for max_windows in [int(n) for n in args.max_windows.split(",")]:
+        rows.append(
+            (f"windows <= {max_windows}", *run(texts, args.batch_size, True, max_windows, args.overlap))
+        )
+
+    print(
+        f"\n{'method':<26}{'seconds':>10}{'sequences':>11}{'tokens':>10}{'cost':>8}"
+        f"{'same star':>11}{'same emotion':>14}{'L1':>8}"
+    )
+    # cost: 與只算前 512 個 token 相比的 token 數
+    base_tokens = rows[1][3].tokens
+    for label, results, elapsed, stats in rows:
+        same_star, same_emotion, distance = agreement(results, reference)
+        print(
+            f"{label:<26}{elapsed:>10.2f}{stats.sequences:>11}{stats.tokens:>10}"
+            f"{stats.tokens / base_tokens:>7.1f}x{same_star:>11.1%}{same_emotion:>14.1%}{distance:>8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
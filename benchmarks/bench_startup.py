@@ -0,0 +1,86 @@
+# benchmarks/bench_startup.py
+# 以 python -X importtime 測量匯入 app (或其他模組) 的時間，在新的 Python 程序中執行，不受目前程序已載入的模組影響
+# 列出總時間、累計時間最長的模組，以及 transformers、torch、matplotlib、pandas、supabase 等套件是否在啟動時就被載入
+#
+# python benchmarks/bench_startup.py [--module app] [--repeat 3] [--top 15]
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 啟動時不應該載入的套件 (第一次用到時才載入)
+HEAVY_PACKAGES = ["transformers", "torch", "matplotlib", "pandas", "supabase"]
+
+
+def run_importtime(module):
+    """
+    在新的程序中匯入 module
+
+    return: (wall time 秒, [(self us, cumulative us, 深度, 模組名稱), ...])
+    """
+    began = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+    )
+    elapsed = time.perf_counter() - began
+
+    entries, other = [], []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            other.append(line)
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # 標題列
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((int(fields[0]), int(fields[1]), depth, name.strip()))
+
+    if result.returncode != 0:
+        print("\n".join(other[-20:]), file=sys.stderr)
+        sys.exit(f"import {module} failed (exit code {result.returncode})")
+    return elapsed, entries
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    runs = [run_importtime(args.module) for _ in range(args.repeat)]
+    # 取 wall time 最短的一次，排除磁碟快取還沒暖好的第一次
+    elapsed, entries = min(runs, key=lambda run: run[0])
+    total_us = sum(self_us for self_us, _, _, _ in entries)
+
+    print(f"import {args.module}: wall {elapsed * 1000:.0f} ms (best of {args.repeat}), "
+          f"import time {total_us / 1000:.0f} ms, {len(entries)} modules")
+
+    # 只看第一層 (直接被 import 的模組)，避免同一段時間在巢狀的子模組中重複計算
+    print(f"\n{'module':<40}{'cumulative (ms)':>16}{'self (ms)':>12}")
+    top_level = sorted((e for e in entries if e[2] <= 1), key=lambda e: e[1], reverse=True)
+    for self_us, cumulative_us, _, name in top_level[: args.top]:
+        print(f"{name:<40}{cumulative_us / 1000:>16.1f}{self_us / 1000:>12.1f}")
+
+    print(f"\n{'package':<40}{'loaded at startup':>20}")
+    imported = {name: cumulative_us for _, cumulative_us, _, name in entries}
+    for package in HEAVY_PACKAGES:
+        if package in imported:
+            status = f"yes ({imported[package] / 1000:.0f} ms)"
+        else:
+            status = "no"
+        print(f"{package:<40}{status:>20}")
+
+
+if __name__ == "__main__":
+    main()
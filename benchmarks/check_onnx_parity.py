@@ -0,0 +1,92 @@
+# benchmarks/check_onnx_parity.py
+# 檢查 onnx 後端與 transformers (fp32 torch，基準) 的結果是否一致：兩者以相同的 token 批次計算，
+# 列出 logits 和各星級機率的最大差距，以及星級、情緒相同的比例；超過容許誤差或星級不同時以 exit code 1 結束
+# 還沒匯出 ONNX 時會先匯出 (見 sentiment/bert_model.py 的 SENTIMENT_ONNX_DIR)
+# 文章取自 CSV資料庫 的 content 欄位，模型可用 SENTIMENT_MODEL 環境變數指定本地目錄
+#
+# python benchmarks/check_onnx_parity.py [--csv CSV資料庫/DB2/stock_news.csv] [--limit 256] [--tolerance 1e-3]
+import os
+import sys
+import csv
+import argparse
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from sentiment.bert_model import (  # noqa: E402
+    OnnxModel,
+    load_onnx_session,
+    plan_batches,
+    star_to_emotion,
+    MAX_TOKENS,
+    MODEL_NAME,
+    TOKENIZE_CHARS,
+    onnx_path,
+)
+
+csv.field_size_limit(1 << 30)
+
+
+def load_articles(path, limit):
+    with open(path, encoding="utf-8") as f:
+        texts = [row["content"] for row in csv.DictReader(f) if row.get("content")]
+    return texts[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--csv", default=os.path.join(ROOT_DIR, "CSV資料庫", "DB2", "stock_news.csv")
+    )
+    parser.add_argument("--limit", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--tolerance", type=float, default=1e-3, help="各星級機率容許的最大差距")
+    args = parser.parse_args()
+
+    import torch
+    from transformers import BertForSequenceClassification, BertTokenizerFast
+
+    tokenizer = BertTokenizerFast.from_pretrained(MODEL_NAME)
+    reference = BertForSequenceClassification.from_pretrained(MODEL_NAME)
+    reference.eval()
+    onnx_model = OnnxModel(load_onnx_session(), reference.config)
+
+    # 與 bert_model.tokenize 相同的截斷方式
+    texts = load_articles(args.csv, args.limit)
+    encoded = tokenizer(
+        [text[:TOKENIZE_CHARS] for text in texts], truncation=True, max_length=MAX_TOKENS
+    )["input_ids"]
+    lengths = [len(input_ids) for input_ids in encoded]
+
+    max_logit_diff = max_prob_diff = 0.0
+    same_star = same_emotion = 0
+    for indices in plan_batches(lengths, args.batch_size):
+        inputs = tokenizer.pad(
+            {"input_ids": [encoded[i] for i in indices]}, padding=True, return_tensors="pt"
+        )
+        with torch.inference_mode():
+            expected = reference(**inputs).logits
+        actual = onnx_model(**inputs).logits
+
+        max_logit_diff = max(max_logit_diff, (expected - actual).abs().max().item())
+        expected_probs, actual_probs = expected.softmax(-1), actual.softmax(-1)
+        max_prob_diff = max(max_prob_diff, (expected_probs - actual_probs).abs().max().item())
+        # 星級依 argmax，id2label 的順序對兩者相同，比較 label index 即可
+        for e, a in zip(expected_probs.argmax(-1).tolist(), actual_probs.argmax(-1).tolist()):
+            same_star += e == a
+            e_star = int(reference.config.id2label[e].split()[0])
+            a_star = int(reference.config.id2label[a].split()[0])
+            same_emotion += star_to_emotion(e_star) == star_to_emotion(a_star)
+
+    print(f"{len(texts)} articles from {args.csv}")
+    print(f"model {MODEL_NAME}, onnx {onnx_path()}")
+    print(f"max |logit diff| {max_logit_diff:.2e}, max |prob diff| {max_prob_diff:.2e}")
+    print(f"same star {same_star / len(texts):.2%}, same emotion {same_emotion / len(texts):.2%}")
+
+    if max_prob_diff > args.tolerance or same_star != len(texts):
+        sys.exit("FAILED: onnx results differ from transformers")
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
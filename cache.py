@@ -0,0 +1,209 @@
+# cache.py
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class ResultCache:
+    """
+    執行緒安全的 LRU + TTL 快取，以位元組數限制總大小
+    max_bytes: 所有項目加總的大小上限
+    ttl: 每個項目的存活秒數
+    """
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (expires_at, size, value)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, value, size=None):
+        if size is None:
+            size = len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+        if size > self.max_bytes:
+            return  # 單一項目超過上限就不快取
+
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (time.monotonic() + self.ttl, size, value)
+            self.total_bytes += size
+
+            # 超過大小上限時，從最久沒使用的項目開始淘汰
+            while self.total_bytes > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, predicate):
+        """刪除所有 predicate(key) 為 True 的項目"""
+        with self.lock:
+            for key in [key for key in self.entries if predicate(key)]:
+                self._remove(key)
+                self.invalidations += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _remove(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.total_bytes -= size
+
+
+class ChartCache(ResultCache):
+    """
+    /analyze 圖表的快取：記憶體中的 LRU (ResultCache)，加上可選的硬碟快取
+    disk_dir: 硬碟快取的資料夾，None 表示只使用記憶體；伺服器重新啟動後仍可使用
+    disk_max_bytes: 硬碟快取的大小上限，超過時刪除最舊的檔案
+    """
+
+    def __init__(self, max_bytes, ttl, disk_dir=None, disk_max_bytes=256 * 1024 * 1024):
+        super().__init__(max_bytes, ttl)
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_hits = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, key):
+        value = super().get(key)
+        if value is not None or not self.disk_dir:
+            return value
+
+        path = self._disk_path(key)
+        try:
+            if os.path.getmtime(path) + self.ttl < time.time():
+                os.remove(path)
+                return None
+            with open(path, encoding="utf-8") as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        # 硬碟命中的項目放回記憶體
+        super().set(key, value)
+        with self.lock:
+            self.disk_hits += 1
+        return value
+
+    def set(self, key, value, size=None):
+        super().set(key, value, size)
+        if not self.disk_dir:
+            return
+
+        # 先寫到暫存檔再改名，其他執行緒不會讀到寫到一半的檔案
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+            self._prune_disk()
+        except OSError as e:
+            print(f"Failed to write chart cache: {e}")
+
+    def stats(self):
+        stats = super().stats()
+        stats["disk_dir"] = self.disk_dir
+        stats["disk_hits"] = self.disk_hits
+        return stats
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, hashlib.sha256(repr(key).encode("utf-8")).hexdigest() + ".json")
+
+    def _prune_disk(self):
+        files = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith(".json"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+# Data.html 新聞搜尋結果的快取，key 為 (topic, source, date, emotion)
+news_search_cache = ResultCache(
+    max_bytes=int(os.getenv("NEWS_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+    ttl=float(os.getenv("NEWS_CACHE_TTL", 300)),
+)
+
+# /analyze 結果的快取，key 為 (mode, topic, start, end, source, data version, format, resolution)，
+# 值為 base64 PNG 圖表或 JSON 統計數列
+chart_cache = ChartCache(
+    max_bytes=int(os.getenv("CHART_CACHE_MAX_BYTES", 32 * 1024 * 1024)),
+    ttl=float(os.getenv("CHART_CACHE_TTL", 3600)),
+    disk_dir=os.getenv("CHART_CACHE_DIR") or None,
+    disk_max_bytes=int(os.getenv("CHART_CACHE_DISK_MAX_BYTES", 256 * 1024 * 1024)),
+)
+
+# 爬蟲頁面使用 "sports"，資料表使用 "sport"
+TOPIC_ALIASES = {"sports": "sport"}
+
+# 每個 topic 在這個程序中寫入新資料的次數，作為圖表快取 key 的資料版本
+topic_versions = {}
+topic_versions_lock = threading.Lock()
+
+
+def news_search_key(topic, source, date, emotion):
+    """把過濾條件正規化成快取的 key，空字串和 None 視為同一個條件"""
+    return (topic or None, source or None, date or None, emotion or None)
+
+
+def invalidate_topic(topic):
+    """
+    某個 topic 寫入新資料後呼叫，刪除該 topic 以及「全部 topic」的搜尋結果
+    """
+    topic = TOPIC_ALIASES.get(topic, topic)
+    news_search_cache.invalidate(lambda key: key[0] in (topic, None))
+
+    # 圖表快取的 key 含有資料版本，版本改變後舊的圖表就不會再被使用，之後由 LRU 淘汰
+    with topic_versions_lock:
+        topic_versions[topic] = topic_versions.get(topic, 0) + 1
+
+
+def topic_version(topic):
+    topic = TOPIC_ALIASES.get(topic, topic)
+    return topic_versions.get(topic, 0)
+
+
+def chart_key(mode, topic, start_date, end_date, source, data_version, output_format="png", resolution="auto"):
+    return (mode, topic, start_date, end_date, source, data_version, output_format, resolution)
@@ -0,0 +1,227 @@
+# crawl_jobs.py
+import os
+import re
+import time
+import uuid
+import threading
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# 確定執行的腳本名稱
+script_map = {
+    ("chinatimes", "stock"): "Proj_ChinaTimes/Proj_ChinaTimes_Stock.py",
+    ("chinatimes", "health"): "Proj_ChinaTimes/Proj_ChinaTimes_health.py",
+    ("chinatimes", "sports"): "Proj_ChinaTimes/Proj_ChinaTimes_sports.py",
+    ("liberty", "stock"): "Proj_ltn/Proj_ltn_Stock.py",
+    ("liberty", "health"): "Proj_ltn/Proj_ltn_health.py",
+    ("liberty", "sports"): "Proj_ltn/Proj_ltn_sports.py",
+    ("tvbs", "stock"): "Proj_tvbs/Proj_tvbs_Stock.py",
+    ("tvbs", "health"): "Proj_tvbs/Proj_tvbs_health.py",
+    ("tvbs", "sports"): "Proj_tvbs/Proj_tvbs_sports.py",
+    ("api", "stock"): "Proj_API/stock_API_news.py",
+    ("api", "health"): "Proj_API/health_API_news.py",
+    ("api", "sports"): "Proj_API/sport_API_news.py",
+}
+
+# 同時執行的爬蟲總數，以及每個新聞網站同時執行的爬蟲數量上限
+MAX_WORKERS = int(os.getenv("CRAWL_WORKERS", 4))
+MAX_JOBS_PER_SITE = int(os.getenv("CRAWL_JOBS_PER_SITE", 1))
+
+# 保留的已結束工作數量
+MAX_FINISHED_JOBS = 100
+
+# 從爬蟲的輸出判斷進度
+PAGE_PATTERN = re.compile(r"current page: (\d+)")
+SAVED_PATTERN = re.compile(r"^(Saved news:|Inserted news:)")
+
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+
+
+def parse_pages(pages):
+    """
+    把請求中的 pages 轉成正整數，與原本執行腳本時 int(sys.argv[1]) 相同，"3" 這樣的字串也接受
+    不是正整數時拋出 ValueError
+    """
+    if isinstance(pages, bool) or not isinstance(pages, (int, str)):
+        raise ValueError(f"Invalid pages: {pages!r}")
+    try:
+        value = int(pages)
+    except ValueError:
+        raise ValueError(f"Invalid pages: {pages!r}")
+    if value < 1:
+        raise ValueError(f"Invalid pages: {pages!r}")
+    return value
+
+
+class CrawlJob:
+    def __init__(self, company, topic, pages, script_name):
+        self.id = uuid.uuid4().hex
+        self.company = company
+        self.topic = topic
+        self.pages = pages
+        self.script_name = script_name
+        self.status = "queued"  # queued -> running -> succeeded / failed / cancelled
+        self.pages_done = 0
+        self.articles_saved = 0
+        self.returncode = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.output = deque(maxlen=50)  # 最後幾行輸出，失敗時回傳
+        self.process = None
+        self.worker = None
+        self.cancel_requested = False
+
+    def record_line(self, line):
+        """解析爬蟲的一行輸出並更新進度"""
+        line = line.rstrip()
+        self.output.append(line)
+
+        page_match = PAGE_PATTERN.search(line)
+        if page_match:
+            # 爬蟲每次從 current page 開始爬 3 頁，之前的頁數已經完成
+            self.pages_done = int(page_match.group(1)) - 1
+        elif SAVED_PATTERN.search(line):
+            self.articles_saved += 1
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "company": self.company,
+            "topic": self.topic,
+            "pages": self.pages,
+            "status": self.status,
+            "pages_done": self.pages_done,
+            "articles_saved": self.articles_saved,
+            "returncode": self.returncode,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "details": "\n".join(self.output) if self.status == "failed" else None,
+        }
+
+
+class CrawlJobManager:
+    """
+    以有限的執行緒池在背景執行爬蟲腳本，並限制每個新聞網站同時執行的數量
+    on_finish: 工作結束後呼叫的函數，參數為 CrawlJob
+    pool: crawl_workers.CrawlWorkerPool，None 時每個工作啟動一個新的 Python 程序
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, max_jobs_per_site=MAX_JOBS_PER_SITE, on_finish=None, pool=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="crawl")
+        self.max_jobs_per_site = max_jobs_per_site
+        self.on_finish = on_finish
+        self.pool = pool
+        self.jobs = {}
+        self.pending = {}  # company -> deque of CrawlJob
+        self.running = {}  # company -> 正在執行的數量
+        self.lock = threading.Lock()
+
+    def submit(self, company, topic, pages):
+        """
+        排入一個爬蟲工作
+        公司或 topic 不存在時拋出 KeyError，pages 不是正整數時拋出 ValueError
+        """
+        script_name = script_map.get((company, topic))
+        if script_name is None:
+            raise KeyError((company, topic))
+        # warm worker 直接呼叫 main(pages)，不再經過 int(sys.argv[1])，在這裡先轉換
+        pages = parse_pages(pages)
+
+        job = CrawlJob(company, topic, pages, script_name)
+        with self.lock:
+            self._prune()
+            self.jobs[job.id] = job
+            self.pending.setdefault(company, deque()).append(job)
+            self._schedule(company)
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            return [job.to_dict() for job in self.jobs.values()]
+
+    def cancel(self, job_id):
+        """取消工作，排隊中的直接移除，執行中的終止爬蟲程序"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.status in FINISHED_STATUSES:
+                return job
+
+            job.cancel_requested = True
+            if job in self.pending.get(job.company, ()):
+                self.pending[job.company].remove(job)
+                job.status = "cancelled"
+                job.finished_at = time.time()
+            elif job.worker is not None:
+                job.worker.kill()
+            elif job.process is not None:
+                job.process.terminate()
+        return job
+
+    def _schedule(self, company):
+        # 呼叫前必須持有 self.lock
+        queue = self.pending.get(company)
+        while queue and self.running.get(company, 0) < self.max_jobs_per_site:
+            job = queue.popleft()
+            self.running[company] = self.running.get(company, 0) + 1
+            self.executor.submit(self._run, job)
+
+    def _run(self, job):
+        try:
+            with self.lock:
+                if job.cancel_requested:
+                    job.status = "cancelled"
+                    return
+                job.status = "running"
+                job.started_at = time.time()
+
+                if self.pool is None:
+                    # 呼叫對應的 Python 檔案，並傳遞頁數參數
+                    job.process = subprocess.Popen(
+                        ["python", "-u", job.script_name, str(job.pages)],
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.STDOUT,
+                        text=True,
+                        encoding="utf-8",
+                        errors="replace",
+                        env={**os.environ, "PYTHONIOENCODING": "utf-8"},
+                    )
+
+            if self.pool is not None:
+                # 在已預先載入爬蟲的常駐 worker 上執行
+                job.returncode = self.pool.run(job, job.record_line)
+            else:
+                for line in job.process.stdout:
+                    job.record_line(line)
+                job.returncode = job.process.wait()
+
+            # 檢查腳本執行狀態
+            if job.cancel_requested:
+                job.status = "cancelled"
+            elif job.returncode == 0:
+                job.pages_done = job.pages
+                job.status = "succeeded"
+            else:
+                job.status = "failed"
+        except Exception as e:
+            job.output.append(f"Server error: {str(e)}")
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            job.process = None
+            with self.lock:
+                self.running[job.company] -= 1
+                self._schedule(job.company)
+            if self.on_finish is not None:
+                self.on_finish(job)
+
+    def _prune(self):
+        # 呼叫前必須持有 self.lock，只保留最近 MAX_FINISHED_JOBS 個已結束的工作
+        finished = [job for job in self.jobs.values() if job.status in FINISHED_STATUSES]
+        for job in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job.id]
@@ -0,0 +1,233 @@
+# crawl_workers.py
+# 常駐的爬蟲 worker：每個 worker 是一個長時間執行的 Python 程序，
+# 啟動時就先 import 所有爬蟲 (selenium、langchain、Supabase client ...)，
+# 之後的工作直接呼叫爬蟲的 main(pages)，不用每次重新啟動直譯器。
+# 每個 Proj_* 資料夾有自己的 .env，worker 在載入和執行每個爬蟲之前把 os.environ 換成該爬蟲的環境
+# (見 use_crawler_env)，與各自以獨立程序執行時相同。
+#
+# 主程序與 worker 之間以 stdin / stdout 傳遞一行一個 JSON：
+#   主程序 -> worker: {"job_id": ..., "script": ..., "pages": ...}
+#   worker -> 主程序: {"event": "ready"} / {"event": "line", "text": ...} / {"event": "done", "returncode": ...}
+import os
+import sys
+import json
+import queue
+import threading
+import traceback
+import subprocess
+import importlib.util
+from dotenv import dotenv_values
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# worker 執行幾個工作後重新啟動，避免爬蟲長時間累積的記憶體
+MAX_JOBS_PER_WORKER = int(os.getenv("CRAWL_JOBS_PER_WORKER", 20))
+
+
+def load_crawler(script_name):
+    """以檔案路徑載入爬蟲模組，只會執行 import，不會開始爬蟲"""
+    module_name = os.path.splitext(os.path.basename(script_name))[0]
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(ROOT_DIR, script_name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def crawler_env(script_name):
+    """
+    爬蟲的 .env，與直接執行腳本時 load_dotenv() 找到的檔案相同：從腳本所在的資料夾往上找第一個 .env
+
+    return: dict，沒有 .env 時為空
+    """
+    folder = os.path.dirname(os.path.join(ROOT_DIR, script_name))
+    while True:
+        path = os.path.join(folder, ".env")
+        if os.path.isfile(path):
+            return {key: value for key, value in dotenv_values(path).items() if value is not None}
+        parent = os.path.dirname(folder)
+        if parent == folder:
+            return {}
+        folder = parent
+
+
+def use_crawler_env(base_env, values):
+    """
+    把 os.environ 換成 worker 啟動時的環境 base_env 加上爬蟲的 .env (values)
+    與 load_dotenv() 相同，已經存在的環境變數不會被 .env 取代；前一個爬蟲的 .env 也不會留下來
+    """
+    env = {**values, **base_env}
+    for key in list(os.environ):
+        if key not in env:
+            del os.environ[key]
+    os.environ.update(env)
+
+
+class LineWriter:
+    """取代 worker 的 sys.stdout，把爬蟲 print 的內容逐行送回主程序"""
+
+    def __init__(self, emit):
+        self.emit = emit
+        self.buffer = ""
+
+    def write(self, text):
+        self.buffer += text
+        while "\n" in self.buffer:
+            line, self.buffer = self.buffer.split("\n", 1)
+            self.emit(line)
+        return len(text)
+
+    def flush(self):
+        if self.buffer:
+            self.emit(self.buffer)
+            self.buffer = ""
+
+
+def serve():
+    """worker 程序的主迴圈"""
+    from crawl_jobs import script_map
+
+    sys.stdin.reconfigure(encoding="utf-8")
+    protocol = sys.stdout
+    protocol.reconfigure(encoding="utf-8")
+
+    def emit(event, **fields):
+        protocol.write(json.dumps({"event": event, **fields}, ensure_ascii=False) + "\n")
+        protocol.flush()
+
+    sys.stdout = LineWriter(lambda line: emit("line", text=line))
+
+    # 爬蟲在 import 時就以 SUPABASE_URL / SUPABASE_KEY 建立 client，載入前也要先換成它的環境
+    base_env = dict(os.environ)
+    envs = {}
+
+    def enter(script_name):
+        if script_name not in envs:
+            envs[script_name] = crawler_env(script_name)
+        use_crawler_env(base_env, envs[script_name])
+
+    # 預先載入所有爬蟲
+    modules = {}
+    for script_name in sorted(set(script_map.values())):
+        try:
+            enter(script_name)
+            modules[script_name] = load_crawler(script_name)
+        except Exception as e:
+            print(f"Failed to load {script_name}: {e}")
+    sys.stdout.flush()
+    emit("ready")
+
+    for raw in sys.stdin:
+        task = json.loads(raw)
+        returncode = 0
+        try:
+            enter(task["script"])
+            module = modules.get(task["script"])
+            if module is None:
+                module = modules[task["script"]] = load_crawler(task["script"])
+            module.main(task["pages"])
+        except SystemExit as e:
+            returncode = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        except Exception:
+            traceback.print_exc(file=sys.stdout)
+            returncode = 1
+        sys.stdout.flush()
+        emit("done", returncode=returncode)
+
+
+class CrawlWorker:
+    """主程序這一端對應的一個 worker 程序"""
+
+    def __init__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, "-u", os.path.join(ROOT_DIR, "crawl_workers.py")],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            cwd=ROOT_DIR,
+            env={**os.environ, "PYTHONIOENCODING": "utf-8"},
+        )
+        self.ready = False
+        self.jobs_done = 0
+
+    def run(self, job_id, script_name, pages, on_line):
+        """
+        執行一個爬蟲工作並等待結束，每一行輸出會呼叫 on_line(line)
+        return: returncode，worker 被終止時為程序的結束代碼
+        """
+        try:
+            task = {"job_id": job_id, "script": script_name, "pages": pages}
+            self.process.stdin.write(json.dumps(task) + "\n")
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError):
+            return self.process.wait()
+
+        for raw in self.process.stdout:
+            try:
+                message = json.loads(raw)
+            except ValueError:
+                on_line(raw)  # 不是經過 print 的輸出
+                continue
+
+            if message["event"] == "ready":
+                self.ready = True
+            elif message["event"] == "line":
+                if self.ready:
+                    on_line(message["text"])
+                else:
+                    print(f"[crawl worker] {message['text']}")  # 預先載入時的輸出
+            elif message["event"] == "done":
+                self.jobs_done += 1
+                return message["returncode"]
+
+        # stdout 結束表示 worker 已經結束 (被取消或當掉)
+        return self.process.wait()
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def kill(self):
+        if self.alive():
+            self.process.terminate()
+
+
+class CrawlWorkerPool:
+    """
+    固定數量的常駐 worker，第一次有工作時才啟動，之後一直保持載入完成的狀態
+    """
+
+    def __init__(self, size, max_jobs_per_worker=MAX_JOBS_PER_WORKER):
+        self.size = size
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.idle = queue.Queue()
+        self.started = False
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if not self.started:
+                for _ in range(self.size):
+                    self.idle.put(CrawlWorker())
+                self.started = True
+
+    def run(self, job, on_line):
+        """在閒置的 worker 上執行 CrawlJob，阻塞直到結束"""
+        self.start()
+        worker = self.idle.get()
+        job.worker = worker
+        try:
+            if job.cancel_requested:
+                return -1
+            return worker.run(job.id, job.script_name, job.pages, on_line)
+        finally:
+            job.worker = None
+            # 被取消、當掉或已執行太多工作的 worker 換成新的
+            if not worker.alive() or worker.jobs_done >= self.max_jobs_per_worker:
+                worker.kill()
+                worker = CrawlWorker()
+            self.idle.put(worker)
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,246 @@
+# db.py
+# Supabase 查詢的共用工具
+import os
+import math
+import threading
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# 平行讀取時同時送出的查詢數量上限 (所有請求共用)
+MAX_IN_FLIGHT = int(os.getenv("DB_FETCH_WORKERS", 8))
+
+fetch_executor = ThreadPoolExecutor(max_workers=MAX_IN_FLIGHT, thread_name_prefix="db_fetch")
+
+# 兩個資料庫的 Supabase client，所有模組共用同一組，第一次用到時才建立
+_clients = None
+_clients_lock = threading.Lock()
+
+# 每個 HTTP 請求的 timeout (秒)，預設與搜尋的時間上限 (NEWS_SEARCH_DEADLINE) 相同，
+# 讓逾時的子查詢結束並釋放共用的執行緒，而不是等到 postgrest client 預設的 timeout
+HTTP_TIMEOUT = float(os.getenv("DB_HTTP_TIMEOUT", os.getenv("NEWS_SEARCH_DEADLINE", 30)))
+
+# 查詢 URL 的長度上限，proxy / CDN 常見的上限約 8 KB，預設保留一些空間
+MAX_URL_LENGTH = int(os.getenv("DB_MAX_URL_LENGTH", 6000))
+
+# in_ 的 id 中，每 RANGE_GROUP_SIZE 個排序後的 id 為一組，
+# 密度 (筆數 / id 範圍) 達到 RANGE_MIN_DENSITY 的組改用範圍條件查詢，不把 id 逐一放進 URL
+RANGE_GROUP_SIZE = int(os.getenv("DB_RANGE_GROUP_SIZE", 1000))
+RANGE_MIN_DENSITY = float(os.getenv("DB_RANGE_MIN_DENSITY", 0.5))
+
+
+def get_clients():
+    """
+    return: [Database 1 的 client, Database 2 的 client]
+    第一次呼叫時才載入 supabase 套件並讀取 .env，app 啟動時不用等待
+    """
+    global _clients
+    with _clients_lock:
+        if _clients is None:
+            from dotenv import load_dotenv
+            from supabase import create_client
+            from supabase.lib.client_options import ClientOptions
+
+            load_dotenv()
+            _clients = [
+                create_client(
+                    os.getenv(f"SUPABASE_URL_{db_index}"),
+                    os.getenv(f"SUPABASE_KEY_{db_index}"),
+                    options=ClientOptions(postgrest_client_timeout=HTTP_TIMEOUT),
+                )
+                for db_index in (1, 2)
+            ]
+    return _clients
+
+
+def fetch_keyset_page(query, after_id=None, limit=1000, key="id"):
+    """
+    以 keyset 方式取得下一頁資料 (key > after_id ORDER BY key LIMIT limit)
+    query: 已套用過濾條件的 Supabase 查詢
+    after_id: 上一頁最後一筆的 key，None 表示從頭開始
+    """
+    if after_id is not None:
+        query = query.gt(key, after_id)
+    return query.order(key).limit(limit).execute().data or []
+
+
+def iter_keyset_pages(build_query, batch_size=1000, key="id", after_id=None):
+    """
+    依 key 遞增逐頁讀取整個查詢結果，每次 yield 一頁資料
+    build_query: 每次呼叫都回傳一個新的、已套用過濾條件的查詢
+
+    PostgREST 可能會把單次回傳的筆數限制在 max-rows 以下，
+    所以只有在拿到空頁時才結束，而不是以筆數少於 batch_size 判斷。
+    """
+    while True:
+        data = fetch_keyset_page(build_query(), after_id, batch_size, key)
+        if not data:
+            break
+        yield data
+
+        after_id = data[-1][key]
+        if after_id is None:
+            break
+
+
+def plan_key_ranges(build_query, shard_size=5000, key="id", count="exact"):
+    """
+    先查詢符合條件的筆數以及 key 的最小、最大值，把 [min, max] 切成每段約 shard_size 筆的範圍
+    build_query(count=None): 回傳新的、已套用過濾條件的查詢，count 會傳給 select
+    count: "exact" 精確筆數，或 "planned" 使用 Postgres 的統計估計 (較快，大表可用)
+
+    估計的筆數或不平均的 id 分布只會讓分段大小不一致，每段內仍以 keyset 讀完，不會漏資料。
+
+    return: list of (low, high)，兩端都包含
+    """
+    first = build_query(count=count).order(key).limit(1).execute()
+    if not first.data:
+        return []
+    low = first.data[0][key]
+    high = build_query().order(key, desc=True).limit(1).execute().data[0][key]
+
+    shards = max(1, math.ceil((first.count or 1) / shard_size))
+    step = max(1, math.ceil((high - low + 1) / shards))
+    return [(start, min(start + step - 1, high)) for start in range(low, high + 1, step)]
+
+
+def fetch_key_range(build_query, low, high, batch_size=1000, key="id", column=None):
+    """
+    以 keyset 讀完 low <= column <= high 範圍內的所有資料
+    column: 範圍條件的欄位，預設與 keyset 分頁的 key 相同
+    """
+    column = column or key
+    rows = []
+    after_id = None
+    while True:
+        data = fetch_keyset_page(build_query().gte(column, low).lte(column, high), after_id, batch_size, key)
+        if not data:
+            break
+        rows.extend(data)
+
+        # 已經讀到範圍的上限就不用再多查一次空頁
+        after_id = data[-1][key]
+        if after_id is None or (column == key and after_id >= high):
+            break
+    return rows
+
+
+def fetch_sharded(build_queries, shard_size=5000, batch_size=1000, key="id", count="exact", executor=None):
+    """
+    count-first 的平行讀取：先同時規劃每個查詢的 key 範圍，再把所有範圍交給執行緒池同時讀取，
+    同時進行的查詢數量受 executor 的 worker 數量 (DB_FETCH_WORKERS) 限制
+    build_queries: dict {名稱: build_query}，build_query 的格式同 plan_key_ranges
+
+    return: dict {名稱: list of rows}，每個查詢的結果依 key 排序
+    """
+    executor = executor or fetch_executor
+
+    plans = {
+        name: executor.submit(plan_key_ranges, build_query, shard_size, key, count)
+        for name, build_query in build_queries.items()
+    }
+    shards = {
+        name: [
+            executor.submit(fetch_key_range, build_queries[name], low, high, batch_size, key)
+            for low, high in plan.result()
+        ]
+        for name, plan in plans.items()
+    }
+    # 分段依 key 由小到大排列，依序接起來就是排序好的結果
+    return {
+        name: [row for future in futures for row in future.result()]
+        for name, futures in shards.items()
+    }
+
+
+def query_url_length(query):
+    """查詢實際送出時的完整 URL 長度"""
+    return len(str(query.session.build_request("GET", query.path, params=query.params).url))
+
+
+def chunk_in_values(values, base_length, max_length=MAX_URL_LENGTH):
+    """
+    把 in_ 的值切成多段，每段放進 URL 後的總長度不超過 max_length
+    base_length: 不含 in_ 的值時的 URL 長度
+    """
+    # postgrest 會連帶載入 httpx，第一次查詢時才載入
+    from postgrest.utils import sanitize_param
+
+    chunk, length = [], base_length
+    for value in values:
+        size = len(quote(sanitize_param(value), safe="")) + 3  # 值之間的逗號編碼成 %2C
+        if chunk and length + size > max_length:
+            yield chunk
+            chunk, length = [], base_length
+        chunk.append(value)
+        length += size
+    if chunk:
+        yield chunk
+
+
+def split_dense_ranges(values, group_size=RANGE_GROUP_SIZE, min_density=RANGE_MIN_DENSITY):
+    """
+    把排序好、不重複的整數 id 分成密集的範圍和零散的 id
+
+    return: (list of (low, high), 零散的 id list)
+    """
+    values = np.asarray(values, dtype=np.int64)
+    ranges, sparse = [], []
+    for start in range(0, len(values), group_size):
+        group = values[start : start + group_size]
+        low, high = int(group[0]), int(group[-1])
+        if len(group) >= group_size and len(group) / (high - low + 1) >= min_density:
+            if ranges and ranges[-1][1] + 1 >= low:
+                ranges[-1] = (ranges[-1][0], high)  # 與前一個範圍相連就合併
+            else:
+                ranges.append((low, high))
+        else:
+            sparse.extend(group.tolist())
+    return ranges, sparse
+
+
+def fetch_in(build_query, column, values, batch_size=1000, key="id", executor=None):
+    """
+    讀取 column IN values 的所有資料，取代一次放入固定筆數的 .in_(column, batch)
+    - 依編碼後的 URL 長度切段，避免超過 proxy 的 URL 上限
+    - 整數 values 中密集的部分改用 low <= column <= high 的範圍條件，讀回後再過濾
+    - 每一段各自以 key 做 keyset 分頁 (不受 max-rows 限制)，並在執行緒池中同時查詢
+    build_query: 回傳新的、已套用其他條件的查詢，select 需包含 column 和 key
+
+    任何一段查詢失敗都會拋出例外，不會回傳缺了一部分的結果
+    return: list of rows，依分段順序排列
+    """
+    executor = executor or fetch_executor
+    values = sorted(set(values))
+    if not values:
+        return []
+
+    if all(isinstance(value, int) for value in values):
+        ranges, sparse = split_dense_ranges(values)
+    else:
+        ranges, sparse = [], values
+
+    def fetch_chunk(chunk):
+        rows = []
+        for data in iter_keyset_pages(lambda: build_query().in_(column, chunk), batch_size, key):
+            rows.extend(data)
+        return rows
+
+    # 每一段以 keyset 分頁時還會加上 order、limit 和 key > 上一頁最後一筆 (以 20 位數估計) 的條件
+    paged_query = build_query().gt(key, 10**19).order(key).limit(batch_size)
+    base_length = query_url_length(paged_query) + len(f"&{column}=in.%28%29")
+    futures = [
+        executor.submit(fetch_chunk, chunk) for chunk in chunk_in_values(sparse, base_length)
+    ]
+    range_futures = [
+        executor.submit(fetch_key_range, build_query, low, high, batch_size, key, column)
+        for low, high in ranges
+    ]
+
+    rows = [row for future in futures for row in future.result()]
+    if range_futures:
+        wanted = set(values)
+        rows.extend(
+            row for future in range_futures for row in future.result() if row[column] in wanted
+        )
+    return rows
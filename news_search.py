@@ -0,0 +1,389 @@
+# news_search.py
+import os
+import json
+import time
+import queue
+import base64
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from utils import fetch_emotion_map
+from db import fetch_keyset_page, iter_keyset_pages, query_url_length, chunk_in_values
+
+# 所有可搜尋的 topic
+TOPICS = ["health", "stock", "sport"]
+
+# 將情緒字串轉換成數值
+EMOTION_VALUES = {"positive": 1, "neutral": 0, "negative": -1}
+
+# 每個 (資料庫, topic) 子查詢在共用的執行緒池中同時執行，2 個資料庫 x 3 個 topic
+search_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("NEWS_SEARCH_WORKERS", 6)),
+    thread_name_prefix="news_search",
+)
+
+# 每次搜尋的時間上限 (秒)，避免單一較慢的資料庫拖住整個搜尋
+SEARCH_DEADLINE = float(os.getenv("NEWS_SEARCH_DEADLINE", 30))
+
+# 分頁搜尋的預設與最大每頁筆數
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# 串流模式每次向資料庫讀取的筆數，越小第一筆結果越快出現
+STREAM_BATCH_SIZE = 100
+
+# 一次查詢全部 (search_news) 時每頁讀取的筆數，PostgREST 預設的 max-rows 為 1000
+SEARCH_BATCH_SIZE = 1000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def build_news_query(supabase_instance, topic_item, source, date, columns=None):
+    """建立 `{topic}_news` 的查詢，並套用新聞來源和日期的過濾條件"""
+    query = supabase_instance.table(f"{topic_item}_news").select(
+        columns or "title, date, content, source, url, id"
+    )
+    if source:
+        query = query.eq("source", source)
+    if date:
+        query = query.eq("date", date)
+    return query
+
+
+def fetch_topic_news(supabase_instance, topic_item, source, date, emotion_value, deadline_at=None):
+    """
+    查詢單一資料庫中某個 topic 的新聞，並批次取得它們的情緒
+    新聞依 id 以 keyset 分頁讀完，不受 PostgREST max-rows 的限制 (結果與 stream_news 相同)
+    deadline_at: time.monotonic() 的時間上限，超過時不再送出後續的查詢
+
+    return: (新聞資料 list, {news_id: emotion})
+    """
+    data = []
+    for page in iter_keyset_pages(
+        lambda: build_news_query(supabase_instance, topic_item, source, date), SEARCH_BATCH_SIZE
+    ):
+        data.extend(page)
+        if deadline_at is not None and time.monotonic() > deadline_at:
+            # 搜尋已經逾時，結果不會被使用，不再查詢下一頁和情緒以免繼續佔住執行緒
+            raise TimeoutError(f"{topic_item}_news search passed the deadline")
+
+    emotion_map = fetch_emotion_map(
+        supabase_instance,
+        topic_item,
+        [item["id"] for item in data if item["id"] is not None],
+        emotion_value,
+    )
+    return data, emotion_map
+
+
+def search_news(clients, topic, source, date, emotion, deadline=SEARCH_DEADLINE):
+    """
+    同時查詢所有 (資料庫, topic)，再依固定順序 (資料庫 -> topic) 合併並去除重複
+    clients: [supabase1, supabase2]
+    deadline: 整個搜尋的時間上限 (秒)，逾時的子查詢會被略過
+
+    return: (results, incomplete)，incomplete 為逾時或失敗的 "DB{index}:{topic}"
+    """
+    topics = TOPICS if topic is None else [topic]
+    emotion_value = EMOTION_VALUES.get(emotion)
+    deadline_at = time.monotonic() + deadline
+
+    futures = {}
+    for index, supabase_instance in enumerate(clients, start=1):
+        for topic_item in topics:
+            futures[(index, topic_item)] = search_executor.submit(
+                fetch_topic_news,
+                supabase_instance,
+                topic_item,
+                source,
+                date,
+                emotion_value,
+                deadline_at,
+            )
+
+    done, not_done = wait(futures.values(), timeout=deadline)
+    for future in not_done:
+        # 尚未開始的子查詢直接取消；已經在執行的子查詢受 HTTP timeout (db.HTTP_TIMEOUT) 限制，
+        # 並在 deadline 之後不再送出新的查詢
+        future.cancel()
+
+    results = []
+    seen_entries = set()
+    incomplete = []
+
+    # 依照提交順序合併，讓結果與逐一查詢時相同
+    for (index, topic_item), future in futures.items():
+        if future not in done:
+            print(f"Search timed out for DB{index}:{topic_item}, skipping.")
+            incomplete.append(f"DB{index}:{topic_item}")
+            continue
+        try:
+            data, emotion_map = future.result()
+        except Exception as e:
+            print(f"Search failed for DB{index}:{topic_item}. Error: {str(e)}")
+            incomplete.append(f"DB{index}:{topic_item}")
+            continue
+
+        for item in data:
+            if item["id"] is None:
+                continue  # 跳過 id 為 None 的項目
+
+            # 避免重複項目
+            unique_key = (item["date"], item["title"], item["source"])
+            if unique_key in seen_entries:
+                continue
+
+            # 若沒有符合條件的情緒，跳過該新聞
+            if not hydrate_emotion(item, emotion_map, emotion):
+                continue
+
+            # 添加到結果中並標記該項目
+            seen_entries.add(unique_key)
+            item["topic"] = topic_item
+            results.append(item)
+
+    return results, incomplete
+
+
+def hydrate_emotion(item, emotion_map, emotion):
+    """
+    把情緒合併到新聞資料中，不符合情緒條件時回傳 False
+    """
+    if item["id"] in emotion_map:
+        item["emotion"] = emotion_map[item["id"]]
+    elif emotion == "all":
+        # 如果情緒為 "all"，仍然保留該條目，但情緒設為 None
+        item["emotion"] = None
+    else:
+        return False
+    return True
+
+
+def encode_cursor(db_index, topic_item, last_id):
+    raw = json.dumps([db_index, topic_item, last_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor):
+    try:
+        db_index, topic_item, last_id = json.loads(base64.urlsafe_b64decode(cursor))
+    except Exception:
+        raise InvalidCursor(f"Invalid cursor: {cursor}")
+    return db_index, topic_item, last_id
+
+
+def fetch_earlier_keys(clients, earlier, items, source, date, emotion):
+    """
+    找出 items 的 (date, title, source) 中，在搜尋順序較前面已經有符合情緒條件的新聞者，
+    一次查詢全部 (search_news) 時這些新聞會被視為重複而略過；
+    較前面的新聞不符合情緒條件時不算重複，與 search_news 相同
+    earlier: list of (資料庫 index, topic, before_id)，before_id 不為 None 時只看 id 小於它的新聞 (同一個表中之前的頁)
+    """
+    emotion_value = EMOTION_VALUES.get(emotion)
+    wanted = {(item["date"], item["title"], item["source"]) for item in items}
+    titles = sorted({item["title"] for item in items if item["title"]})
+    keys = set()
+
+    for db_index, topic_item, before_id in earlier:
+        supabase_instance = clients[db_index - 1]
+
+        def build_query():
+            query = build_news_query(
+                supabase_instance, topic_item, source, date, "id, date, title, source"
+            )
+            if before_id is not None:
+                query = query.lt("id", before_id)
+            return query
+
+        # 中文標題編碼後很長，依 URL 長度決定每次放入幾個標題
+        base_length = query_url_length(build_query()) + len("&title=in.%28%29")
+        rows = []
+        for chunk in chunk_in_values(titles, base_length):
+            for row in build_query().in_("title", chunk).execute().data or []:
+                key = (row["date"], row["title"], row["source"])
+                if row["id"] is not None and key in wanted and key not in keys:
+                    rows.append(row)
+        if not rows:
+            continue
+
+        emotion_map = fetch_emotion_map(
+            supabase_instance, topic_item, [row["id"] for row in rows], emotion_value
+        )
+        for row in rows:
+            if hydrate_emotion(row, emotion_map, emotion):
+                keys.add((row["date"], row["title"], row["source"]))
+    return keys
+
+
+def search_news_page(clients, topic, source, date, emotion, cursor=None, limit=None):
+    """
+    依 (資料庫, topic, id) 順序分頁搜尋新聞
+    cursor: 上一頁回傳的 next_cursor，None 表示第一頁
+    limit: 每頁筆數，最多 MAX_PAGE_SIZE
+
+    return: (results, next_cursor)，沒有下一頁時 next_cursor 為 None
+    """
+    topics = TOPICS if topic is None else [topic]
+    emotion_value = EMOTION_VALUES.get(emotion)
+    limit = max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+
+    positions = [
+        (index, topic_item)
+        for index in range(1, len(clients) + 1)
+        for topic_item in topics
+    ]
+    start, after_id = 0, None
+    if cursor:
+        db_index, topic_item, after_id = decode_cursor(cursor)
+        if (db_index, topic_item) not in positions:
+            raise InvalidCursor(f"Invalid cursor: {cursor}")
+        start = positions.index((db_index, topic_item))
+
+    results = []
+    seen_entries = set()
+
+    for position in range(start, len(positions)):
+        db_index, topic_item = positions[position]
+        supabase_instance = clients[db_index - 1]
+        # 從 cursor 繼續時，同一個表中之前的頁也要檢查是否重複
+        resumed = position == start and after_id is not None
+        while True:
+            data = fetch_keyset_page(
+                build_news_query(supabase_instance, topic_item, source, date),
+                after_id,
+                limit,
+            )
+            data = [item for item in data if item["id"] is not None]
+            if not data:
+                break
+
+            emotion_map = fetch_emotion_map(
+                supabase_instance, topic_item, [item["id"] for item in data], emotion_value
+            )
+            # 這一次呼叫中已經看過的新聞由 seen_entries 處理，之前的 (資料庫, topic) 和之前的頁則查詢資料庫
+            earlier = [(index, item_topic, None) for index, item_topic in positions[:position]]
+            if resumed:
+                earlier.append((db_index, topic_item, data[0]["id"]))
+            earlier_keys = fetch_earlier_keys(clients, earlier, data, source, date, emotion)
+
+            for item in data:
+                after_id = item["id"]
+
+                # 避免重複項目
+                unique_key = (item["date"], item["title"], item["source"])
+                if unique_key in seen_entries or unique_key in earlier_keys:
+                    continue
+                if not hydrate_emotion(item, emotion_map, emotion):
+                    continue
+
+                seen_entries.add(unique_key)
+                item["topic"] = topic_item
+                results.append(item)
+
+                if len(results) == limit:
+                    return results, encode_cursor(db_index, topic_item, after_id)
+
+        # 換到下一個 (資料庫, topic) 時從頭開始
+        after_id = None
+
+    return results, None
+
+
+def stream_topic_news(
+    supabase_instance, topic_item, source, date, emotion_value, batch_size, batches, deadline_at, stopped
+):
+    """
+    在 search_executor 中逐頁讀取一個 (資料庫, topic)，每一頁連同情緒放進 batches
+    讀完時放入 None，逾時或失敗時放入例外；stopped 被設定 (串流已結束) 時不再讀取
+    """
+    try:
+        pages = iter_keyset_pages(
+            lambda: build_news_query(supabase_instance, topic_item, source, date), batch_size
+        )
+        for data in pages:
+            if stopped.is_set():
+                return
+            if time.monotonic() > deadline_at:
+                raise TimeoutError(f"{topic_item}_news search passed the deadline")
+            emotion_map = fetch_emotion_map(
+                supabase_instance,
+                topic_item,
+                [item["id"] for item in data if item["id"] is not None],
+                emotion_value,
+            )
+            batches.put((data, emotion_map))
+        batches.put(None)
+    except Exception as e:
+        batches.put(e)
+
+
+def stream_news(
+    clients, topic, source, date, emotion, batch_size=STREAM_BATCH_SIZE, deadline=SEARCH_DEADLINE, incomplete=None
+):
+    """
+    同時查詢所有 (資料庫, topic)，依固定順序 (資料庫 -> topic -> id) 合併，每合併完一筆就 yield 出去
+    deadline: 整個搜尋的時間上限 (秒)，逾時或失敗的 (資料庫, topic) 不再繼續 (與 search_news 相同)
+    incomplete: list，逾時或失敗的 "DB{index}:{topic}" 會加到這裡，串流結束後由呼叫端檢查
+    """
+    topics = TOPICS if topic is None else [topic]
+    emotion_value = EMOTION_VALUES.get(emotion)
+    deadline_at = time.monotonic() + deadline
+    if incomplete is None:
+        incomplete = []
+
+    stopped = threading.Event()
+    producers = {}
+    for index, supabase_instance in enumerate(clients, start=1):
+        for topic_item in topics:
+            batches = queue.Queue()
+            future = search_executor.submit(
+                stream_topic_news,
+                supabase_instance,
+                topic_item,
+                source,
+                date,
+                emotion_value,
+                batch_size,
+                batches,
+                deadline_at,
+                stopped,
+            )
+            producers[(index, topic_item)] = (batches, future)
+
+    seen_entries = set()
+    try:
+        for (index, topic_item), (batches, _) in producers.items():
+            while True:
+                try:
+                    batch = batches.get(timeout=max(0.0, deadline_at - time.monotonic()))
+                except queue.Empty:
+                    batch = TimeoutError(f"{topic_item}_news search passed the deadline")
+                if batch is None:
+                    break
+                if isinstance(batch, Exception):
+                    # 已經送出的新聞無法收回，其餘部分略過並回報不完整
+                    print(f"Search failed for DB{index}:{topic_item}. Error: {str(batch)}")
+                    incomplete.append(f"DB{index}:{topic_item}")
+                    break
+
+                data, emotion_map = batch
+                for item in data:
+                    if item["id"] is None:
+                        continue
+
+                    # 避免重複項目
+                    unique_key = (item["date"], item["title"], item["source"])
+                    if unique_key in seen_entries:
+                        continue
+                    if not hydrate_emotion(item, emotion_map, emotion):
+                        continue
+
+                    seen_entries.add(unique_key)
+                    item["topic"] = topic_item
+                    yield item
+    finally:
+        # 串流結束或使用者中途離開：還沒開始的查詢取消，執行中的查詢在下一頁之前停止
+        stopped.set()
+        for _, future in producers.values():
+            future.cancel()
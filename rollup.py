@@ -0,0 +1,528 @@
+# rollup.py
+# 每日情緒彙總表：以 (topic, source, date) 為單位預先計算情緒數、星級數和 sentiment 的總和與筆數，
+# /analyze 的資料庫模式直接讀取這張表，查詢量只跟天數有關，不用每次重新讀取所有新聞和情緒。
+# 彙總表存放在本地的 SQLite 檔案 (ROLLUP_PATH)，可從兩個 Supabase 資料庫或 CSV資料庫 的快照建立：
+#
+#   python rollup.py build --from supabase [--topic stock]
+#   python rollup.py build --from csv [--topic stock]
+#   python rollup.py repair --topic stock --start 2024-10-01 --end 2024-10-31 [--from supabase]
+#   python rollup.py check --topic stock --start 2024-01-01 --end 2024-12-31 [--source all]
+#   python rollup.py status
+#
+# 情緒分析程式每寫入一筆情緒就呼叫 record_sentiment 更新彙總表。
+# rollup_members 記錄已經計入的 (topic, db_index, news_id)，同一篇新聞重複寫入或重新執行都只會計算一次，
+# 與讀取原始資料時「同一個 (db_index, news_id) 只取第一筆情緒」的規則相同。
+# 每篇新聞的日期和來源取自 `{topic}_news`，同一個 id 也出現在 `{topic}_news_API` 時不使用後者
+# (與 utils.fetch_news_rows 相同)；check 比較彙總表和直接讀取原始資料的結果。
+# app 匯入這個模組時只用到版本和 record_sentiment，pandas 在讀寫 DataFrame 的函數中才載入。
+import os
+import time
+import sqlite3
+import argparse
+import numpy as np
+from aggregation import SentimentAggregate, EMOTION_LABELS
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ROLLUP_PATH = os.getenv("ROLLUP_PATH", os.path.join(ROOT_DIR, "rollup.sqlite3"))
+CSV_DIR = os.path.join(ROOT_DIR, "CSV資料庫")
+
+TOPICS = ["health", "stock", "sport"]
+
+STAR_COLUMNS = [f"star{star}" for star in range(1, 6)]
+COUNT_COLUMNS = ["positive", "neutral", "negative"] + STAR_COLUMNS + ["sentiment_sum", "sentiment_count"]
+MEMBER_COLUMNS = ["db_index", "news_id", "source", "date", "emotion", "star", "sentiment"]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS daily_sentiment (
+    topic TEXT NOT NULL,
+    source TEXT NOT NULL,
+    date TEXT NOT NULL,
+    {", ".join(f"{column} INTEGER NOT NULL DEFAULT 0" for column in COUNT_COLUMNS if column != "sentiment_sum")},
+    sentiment_sum REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (topic, source, date)
+);
+CREATE INDEX IF NOT EXISTS daily_sentiment_date ON daily_sentiment (topic, date);
+
+-- 已計入彙總表的新聞，以及計入時的來源、日期和情緒，repair 時用來重新計算
+CREATE TABLE IF NOT EXISTS rollup_members (
+    topic TEXT NOT NULL,
+    db_index INTEGER NOT NULL,
+    news_id INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    date TEXT NOT NULL,
+    emotion INTEGER,
+    star INTEGER,
+    sentiment REAL,
+    PRIMARY KEY (topic, db_index, news_id)
+);
+CREATE INDEX IF NOT EXISTS rollup_members_date ON rollup_members (topic, date);
+
+-- 已經建立過彙總表的 topic，/analyze 只在這裡有紀錄時才使用彙總表
+CREATE TABLE IF NOT EXISTS rollup_topics (
+    topic TEXT PRIMARY KEY,
+    origin TEXT NOT NULL,
+    built_at REAL NOT NULL
+);
+
+-- 每次彙總資料改變就加一，圖表快取以此判斷資料是否更新過 (其他程序寫入時也適用)
+CREATE TABLE IF NOT EXISTS rollup_versions (
+    topic TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+
+def connect(path=None):
+    """開啟彙總表，每個執行緒各自開啟自己的連線"""
+    conn = sqlite3.connect(path or ROLLUP_PATH, timeout=30)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def merge_members(news_rows, sentiment_rows):
+    """
+    合併新聞和情緒資料
+    news_rows: DataFrame，欄位 db_index、id、date、source
+    sentiment_rows: DataFrame，欄位 db_index、news_id、sentiment、emotion、star，
+                    同一個 (db_index, news_id) 只計算第一筆
+
+    return: DataFrame，欄位 MEMBER_COLUMNS
+    """
+    sentiments = sentiment_rows.drop_duplicates(["db_index", "news_id"], keep="first")
+    merged = news_rows.merge(
+        sentiments, left_on=["db_index", "id"], right_on=["db_index", "news_id"], how="inner"
+    )
+    merged["source"] = merged["source"].fillna("")
+    merged["date"] = merged["date"].astype(str).str[:10]
+    return merged[MEMBER_COLUMNS]
+
+
+def summarize(members):
+    """
+    依 (source, date) 加總 merge_members 的結果
+
+    return: DataFrame，欄位 source、date 和 COUNT_COLUMNS
+    """
+    members = members.copy()
+    for value, label in EMOTION_LABELS.items():
+        members[label] = (members["emotion"] == value).astype(np.int64)
+    for star, column in enumerate(STAR_COLUMNS, start=1):
+        members[column] = (members["star"] == star).astype(np.int64)
+    members["sentiment_count"] = members["sentiment"].notna().astype(np.int64)
+    members["sentiment_sum"] = members["sentiment"].astype(float).fillna(0.0)
+
+    return members.groupby(["source", "date"], as_index=False)[COUNT_COLUMNS].sum()
+
+
+def member_counts(emotion, star, sentiment):
+    """一篇新聞對 COUNT_COLUMNS 各欄位的貢獻"""
+    counts = {column: 0 for column in COUNT_COLUMNS}
+    if emotion in EMOTION_LABELS:
+        counts[EMOTION_LABELS[emotion]] = 1
+    if star in range(1, 6):
+        counts[f"star{star}"] = 1
+    if sentiment is not None:
+        counts["sentiment_sum"] = float(sentiment)
+        counts["sentiment_count"] = 1
+    return counts
+
+
+def insert_daily(conn, topic, daily):
+    conn.executemany(
+        f"INSERT INTO daily_sentiment (topic, source, date, {', '.join(COUNT_COLUMNS)}) "
+        f"VALUES (?, ?, ?, {', '.join('?' for _ in COUNT_COLUMNS)})",
+        (
+            (topic, row.source, row.date, *(getattr(row, column) for column in COUNT_COLUMNS))
+            for row in daily.itertuples(index=False)
+        ),
+    )
+
+
+def insert_members(conn, topic, members):
+    """寫入 rollup_members，已經計入的 (db_index, news_id) 不會重複寫入，回傳實際寫入的筆數"""
+    import pandas as pd
+
+    return conn.executemany(
+        f"INSERT OR IGNORE INTO rollup_members (topic, {', '.join(MEMBER_COLUMNS)}) "
+        f"VALUES (?, {', '.join('?' for _ in MEMBER_COLUMNS)})",
+        (
+            (
+                topic,
+                int(row.db_index),
+                int(row.news_id),
+                row.source,
+                row.date,
+                None if pd.isna(row.emotion) else int(row.emotion),
+                None if pd.isna(row.star) else int(row.star),
+                None if pd.isna(row.sentiment) else float(row.sentiment),
+            )
+            for row in members.itertuples(index=False)
+        ),
+    ).rowcount
+
+
+def summarize_ledger(conn, topic, start_date, end_date):
+    """以 rollup_members 中 start_date ~ end_date 的新聞重新計算這段日期的 daily_sentiment (與 member_counts 相同的規則)"""
+    totals = [f"COUNT(CASE WHEN emotion = {value} THEN 1 END)" for value in EMOTION_LABELS]
+    totals += [f"COUNT(CASE WHEN star = {star} THEN 1 END)" for star in range(1, 6)]
+    totals += ["TOTAL(sentiment)", "COUNT(sentiment)"]
+    conn.execute(
+        f"INSERT INTO daily_sentiment (topic, source, date, {', '.join(COUNT_COLUMNS)}) "
+        f"SELECT topic, source, date, {', '.join(totals)} FROM rollup_members "
+        "WHERE topic = ? AND date >= ? AND date <= ? GROUP BY source, date",
+        (topic, start_date, end_date),
+    )
+
+
+def bump_version(conn, topic):
+    conn.execute(
+        "INSERT INTO rollup_versions (topic, version) VALUES (?, 1) "
+        "ON CONFLICT (topic) DO UPDATE SET version = version + 1",
+        (topic,),
+    )
+
+
+def replace_topic(conn, topic, members, origin):
+    """以新的資料取代某個 topic 的整個彙總表"""
+    with conn:
+        conn.execute("DELETE FROM rollup_members WHERE topic = ?", (topic,))
+        conn.execute("DELETE FROM daily_sentiment WHERE topic = ?", (topic,))
+        insert_members(conn, topic, members)
+        insert_daily(conn, topic, summarize(members))
+        conn.execute(
+            "INSERT OR REPLACE INTO rollup_topics (topic, origin, built_at) VALUES (?, ?, ?)",
+            (topic, origin, time.time()),
+        )
+        bump_version(conn, topic)
+
+
+def replace_date_range(conn, topic, members, start_date, end_date):
+    """
+    只重新計算 start_date ~ end_date 之間的彙總資料，其他日期不變
+    已經以範圍外的日期計入的新聞 (例如日期被修改過) 不會再計入一次，每日統計由實際寫入的 rollup_members 重新加總，
+    要讓這些新聞改用新的日期需重新 build 或 repair 包含舊日期的範圍
+
+    return: 實際計入的新聞筆數
+    """
+    with conn:
+        conn.execute(
+            "DELETE FROM rollup_members WHERE topic = ? AND date >= ? AND date <= ?",
+            (topic, start_date, end_date),
+        )
+        conn.execute(
+            "DELETE FROM daily_sentiment WHERE topic = ? AND date >= ? AND date <= ?",
+            (topic, start_date, end_date),
+        )
+        inserted = insert_members(conn, topic, members)
+        summarize_ledger(conn, topic, start_date, end_date)
+        bump_version(conn, topic)
+    return inserted
+
+
+def record_sentiment(topic, db_index, news, sentiment, star, emotion, path=None):
+    """
+    寫入一筆情緒後更新彙總表，同一篇新聞只會計算一次
+    db_index: 情緒寫入的資料庫 (1 或 2)
+    news: 新聞資料，需要 id、date、source
+
+    return: True 表示這次有計入，False 表示先前已經計入過
+    """
+    source = news.get("source") or ""
+    date = str(news["date"])[:10]
+    counts = member_counts(emotion, star, sentiment)
+
+    conn = connect(path)
+    try:
+        with conn:
+            inserted = conn.execute(
+                f"INSERT OR IGNORE INTO rollup_members (topic, {', '.join(MEMBER_COLUMNS)}) "
+                f"VALUES (?, {', '.join('?' for _ in MEMBER_COLUMNS)})",
+                (topic, db_index, news["id"], source, date, emotion, star, sentiment),
+            ).rowcount
+            if inserted:
+                conn.execute(
+                    f"INSERT INTO daily_sentiment (topic, source, date, {', '.join(COUNT_COLUMNS)}) "
+                    f"VALUES (?, ?, ?, {', '.join('?' for _ in COUNT_COLUMNS)}) "
+                    "ON CONFLICT (topic, source, date) DO UPDATE SET "
+                    + ", ".join(f"{column} = {column} + excluded.{column}" for column in COUNT_COLUMNS),
+                    (topic, source, date, *(counts[column] for column in COUNT_COLUMNS)),
+                )
+                bump_version(conn, topic)
+    finally:
+        conn.close()
+    return bool(inserted)
+
+
+def db_index_for_url(url):
+    """依 Supabase URL 判斷是資料庫 1 還是 2，都不是時回傳 None"""
+    for db_index in (1, 2):
+        if url and url == os.getenv(f"SUPABASE_URL_{db_index}"):
+            return db_index
+    return None
+
+
+def load_supabase(topic, start_date="0001-01-01", end_date="9999-12-31"):
+    """從兩個 Supabase 資料庫讀取某個 topic 在日期範圍內的新聞和情緒"""
+    import pandas as pd
+    from utils import fetch_news_rows, fetch_sentiment_data, news_ids_by_db
+
+    news_rows = fetch_news_rows(topic, start_date, end_date, "all")
+    sentiment_rows = pd.DataFrame(
+        fetch_sentiment_data(news_ids_by_db(news_rows), topic),
+        columns=["db_index", "news_id", "sentiment", "emotion", "star"],
+    )
+    return news_rows, sentiment_rows
+
+
+def load_csv(topic, start_date="0001-01-01", end_date="9999-12-31", csv_dir=CSV_DIR):
+    """從 CSV資料庫/DB1、DB2 的快照讀取某個 topic 的新聞和情緒，沒有匯出的資料表會略過"""
+    import pandas as pd
+
+    news_frames, sentiment_frames = [], []
+    for db_index in (1, 2):
+        db_dir = os.path.join(csv_dir, f"DB{db_index}")
+
+        # "news" 在 "news_API" 前面，id 重複時保留 `{topic}_news` 的資料，之後才篩選日期 (與 fetch_news_rows 相同)
+        for table_suffix in ["news", "news_API"]:
+            path = os.path.join(db_dir, f"{topic}_{table_suffix}.csv")
+            if os.path.exists(path):
+                frame = pd.read_csv(path, usecols=["id", "date", "source"], dtype={"source": str, "date": str})
+                news_frames.append(frame.assign(db_index=db_index))
+
+        path = os.path.join(db_dir, f"{topic}_news_sentiment.csv")
+        if os.path.exists(path):
+            frame = pd.read_csv(path, usecols=["id", "news_id", "sentiment", "emotion", "star"])
+            sentiment_frames.append(frame.sort_values("id").assign(db_index=db_index))
+
+    news_rows = pd.concat(news_frames, ignore_index=True) if news_frames else pd.DataFrame(
+        columns=["db_index", "id", "date", "source"]
+    )
+    news_rows = news_rows.drop_duplicates(["db_index", "id"], keep="first")
+    news_rows = news_rows[(news_rows["date"] >= start_date) & (news_rows["date"] <= end_date)]
+    sentiment_rows = pd.concat(sentiment_frames, ignore_index=True) if sentiment_frames else pd.DataFrame(
+        columns=["db_index", "news_id", "sentiment", "emotion", "star"]
+    )
+    return news_rows, sentiment_rows
+
+
+def load(topic, origin, start_date="0001-01-01", end_date="9999-12-31"):
+    loader = load_supabase if origin == "supabase" else load_csv
+    return merge_members(*loader(topic, start_date, end_date))
+
+
+def build(topic, origin="supabase", path=None):
+    """
+    重新建立某個 topic 的彙總表
+    origin: "supabase" 或 "csv"
+
+    return: 計入的新聞筆數
+    """
+    members = load(topic, origin)
+
+    conn = connect(path)
+    try:
+        replace_topic(conn, topic, members, origin)
+    finally:
+        conn.close()
+    return len(members)
+
+
+def repair(topic, start_date, end_date, origin="supabase", path=None):
+    """
+    從原始資料重新計算 start_date ~ end_date 的彙總資料，例如情緒被刪除或修改過之後
+
+    return: (計入的新聞筆數, 讀取到的新聞筆數)，兩者不同時表示有新聞先前已經以其他日期計入
+    """
+    members = load(topic, origin, start_date, end_date)
+
+    conn = connect(path)
+    try:
+        inserted = replace_date_range(conn, topic, members, start_date, end_date)
+    finally:
+        conn.close()
+    return inserted, len(members)
+
+
+def is_built(topic, path=None):
+    """這個 topic 是否已經建立過彙總表"""
+    conn = connect(path)
+    try:
+        row = conn.execute("SELECT 1 FROM rollup_topics WHERE topic = ?", (topic,)).fetchone()
+    finally:
+        conn.close()
+    return row is not None
+
+
+def data_version(topic, path=None):
+    """彙總資料的版本，還沒有任何資料時為 0"""
+    conn = connect(path)
+    try:
+        row = conn.execute("SELECT version FROM rollup_versions WHERE topic = ?", (topic,)).fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else 0
+
+
+def query_daily(topic, start_date, end_date, source, path=None):
+    """
+    讀取日期範圍內每天的統計，source 為 "all" 時加總所有來源
+
+    return: DataFrame，欄位 date 和 COUNT_COLUMNS，依日期排序
+    """
+    import pandas as pd
+
+    sql = (
+        f"SELECT date, {', '.join(f'SUM({column}) AS {column}' for column in COUNT_COLUMNS)} "
+        "FROM daily_sentiment WHERE topic = ? AND date >= ? AND date <= ?"
+    )
+    params = [topic, start_date, end_date]
+    if source != "all":
+        sql += " AND source = ?"
+        params.append(source)
+    sql += " GROUP BY date ORDER BY date"
+
+    conn = connect(path)
+    try:
+        return pd.read_sql_query(sql, conn, params=params)
+    finally:
+        conn.close()
+
+
+def daily_aggregate(daily):
+    """把 query_daily 的每日統計加總成一個 SentimentAggregate"""
+    totals = daily[COUNT_COLUMNS].sum()
+    return SentimentAggregate(
+        emotion_counts={label: int(totals[label]) for label in EMOTION_LABELS.values()},
+        star_counts={star: int(totals[column]) for star, column in enumerate(STAR_COLUMNS, start=1)},
+    )
+
+
+def daily_stats(daily):
+    """每日平均 sentiment 和筆數，index 為日期，欄位 mean、count"""
+    import pandas as pd
+
+    daily = daily[daily["sentiment_count"] > 0]
+    return pd.DataFrame(
+        {
+            "mean": (daily["sentiment_sum"] / daily["sentiment_count"]).to_numpy(),
+            "count": daily["sentiment_count"].to_numpy(dtype=np.int64),
+        },
+        index=pd.DatetimeIndex(pd.to_datetime(daily["date"]), name="date"),
+    )
+
+
+def day_totals(stats):
+    """把每日統計 (index 為日期，欄位 mean、count) 換成每天的筆數和 sentiment 總和"""
+    import pandas as pd
+
+    totals = pd.DataFrame(
+        {
+            "count": stats["count"].to_numpy(dtype=np.int64),
+            "sum": stats["mean"].to_numpy(dtype=float) * stats["count"].to_numpy(dtype=float),
+        },
+        index=pd.DatetimeIndex(stats.index).normalize(),
+    )
+    return totals.groupby(level=0).sum()
+
+
+def check(topic, start_date, end_date, source="all", path=None):
+    """
+    比較彙總表和直接讀取原始資料 (utils.AnalysisContext，不使用彙總表) 的情緒分布和每日統計
+
+    return: list of 不一致的說明，空的 list 表示結果相同
+    """
+    from utils import AnalysisContext
+
+    if not is_built(topic, path):
+        return [f"{topic}: rollup has not been built"]
+
+    raw = AnalysisContext(topic, start_date, end_date, source)
+    daily = query_daily(topic, start_date, end_date, source, path)
+    rolled = daily_aggregate(daily)
+
+    problems = []
+    if rolled.emotion_counts != raw.aggregate.emotion_counts:
+        problems.append(f"emotion counts: rollup {rolled.emotion_counts}, raw {raw.aggregate.emotion_counts}")
+    if rolled.star_counts != raw.aggregate.star_counts:
+        problems.append(f"star counts: rollup {rolled.star_counts}, raw {raw.aggregate.star_counts}")
+
+    expected = day_totals(raw.daily_stats)
+    actual = day_totals(daily_stats(daily))
+    merged = expected.join(actual, how="outer", lsuffix="_raw", rsuffix="_rollup").fillna(0)
+    differs = (merged["count_raw"] != merged["count_rollup"]) | ~np.isclose(
+        merged["sum_raw"], merged["sum_rollup"]
+    )
+    for date, row in merged[differs].iterrows():
+        problems.append(
+            f"{date.date()}: rollup {int(row['count_rollup'])} articles (sum {row['sum_rollup']:.4f}), "
+            f"raw {int(row['count_raw'])} articles (sum {row['sum_raw']:.4f})"
+        )
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="建立或查看每日情緒彙總表")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="重新建立彙總表")
+    build_parser.add_argument("--from", dest="origin", choices=["supabase", "csv"], default="supabase")
+    build_parser.add_argument("--topic", choices=TOPICS, action="append", help="預設為所有 topic")
+
+    repair_parser = subparsers.add_parser("repair", help="從原始資料重新計算一段日期的彙總資料")
+    repair_parser.add_argument("--from", dest="origin", choices=["supabase", "csv"], default="supabase")
+    repair_parser.add_argument("--topic", choices=TOPICS, action="append", help="預設為所有 topic")
+    repair_parser.add_argument("--start", required=True, help="YYYY-MM-DD")
+    repair_parser.add_argument("--end", required=True, help="YYYY-MM-DD")
+
+    check_parser = subparsers.add_parser("check", help="比較彙總表和直接讀取原始資料的結果")
+    check_parser.add_argument("--topic", choices=TOPICS, action="append", help="預設為所有 topic")
+    check_parser.add_argument("--start", default="0001-01-01", help="YYYY-MM-DD")
+    check_parser.add_argument("--end", default="9999-12-31", help="YYYY-MM-DD")
+    check_parser.add_argument("--source", default="all")
+
+    subparsers.add_parser("status", help="列出已建立的 topic")
+
+    args = parser.parse_args()
+    print(f"Rollup database: {ROLLUP_PATH}")
+
+    if args.command == "build":
+        for topic in args.topic or TOPICS:
+            started = time.perf_counter()
+            count = build(topic, args.origin)
+            print(f"{topic}: {count} articles from {args.origin} in {time.perf_counter() - started:.1f}s")
+    elif args.command == "repair":
+        for topic in args.topic or TOPICS:
+            started = time.perf_counter()
+            count, loaded = repair(topic, args.start, args.end, args.origin)
+            print(
+                f"{topic}: {count} articles between {args.start} and {args.end} "
+                f"from {args.origin} in {time.perf_counter() - started:.1f}s"
+            )
+            if count != loaded:
+                print(f"{topic}: {loaded - count} articles were already counted under dates outside the range")
+    elif args.command == "check":
+        failed = False
+        for topic in args.topic or TOPICS:
+            problems = check(topic, args.start, args.end, args.source)
+            for problem in problems:
+                print(f"{topic}: {problem}")
+            print(f"{topic}: {'MISMATCH' if problems else 'OK'} between {args.start} and {args.end} ({args.source})")
+            failed = failed or bool(problems)
+        if failed:
+            raise SystemExit(1)
+    else:
+        conn = connect()
+        try:
+            for topic, origin, built_at in conn.execute("SELECT topic, origin, built_at FROM rollup_topics"):
+                days, articles = conn.execute(
+                    "SELECT COUNT(DISTINCT date), COALESCE(SUM(sentiment_count), 0) FROM daily_sentiment WHERE topic = ?",
+                    (topic,),
+                ).fetchone()
+                print(f"{topic}: {articles} articles over {days} days, built from {origin} at {time.ctime(built_at)}")
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
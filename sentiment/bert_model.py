@@ -0,0 +1,415 @@
+# sentiment/bert_model.py
+# nlptown 多語言 BERT 情緒模型的載入和批次推論，topic_sentiment.py 和各 topic 的腳本共用
+# 多篇文章一起送進模型，每一批只補齊到該批中最長的文章 (dynamic padding)；
+# 送進模型前先依 token 長度排序再分批，長度相近的文章在同一批，補齊的 [PAD] 最少，
+# 結果再依原本的順序放回；長文章模式的 window 也和其他文章一起排序分批
+import os
+import re
+import threading
+from types import SimpleNamespace
+
+# 模型名稱，也可以設定成本地下載好的模型目錄
+MODEL_NAME = os.getenv("SENTIMENT_MODEL", "nlptown/bert-base-multilingual-uncased-sentiment")
+
+# 推論的後端：torch (fp32，預設，作為其他後端的基準)、int8 (以 torch dynamic quantization 把 Linear 層量化成 INT8，
+# 只適用於 CPU) 或 onnx (匯出成 ONNX 以 onnxruntime 的 CPU execution provider 執行)
+BACKEND = os.getenv("SENTIMENT_BACKEND", "torch").lower()
+BACKENDS = ("torch", "int8", "onnx")
+
+# onnx 後端：第一次使用時把模型匯出到 SENTIMENT_ONNX_DIR，之後直接載入 (更換模型內容後刪除該目錄即可重新匯出)；
+# SENTIMENT_ONNX_THREADS 為 onnxruntime 的 intra-op 執行緒數，0 表示由 onnxruntime 決定
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ONNX_DIR = os.getenv("SENTIMENT_ONNX_DIR", os.path.join(ROOT_DIR, "onnx_models"))
+ONNX_THREADS = int(os.getenv("SENTIMENT_ONNX_THREADS", 0))
+ONNX_INPUTS = ("input_ids", "attention_mask", "token_type_ids")
+
+# 每次送進模型的文章數
+BATCH_SIZE = int(os.getenv("SENTIMENT_BATCH_SIZE", 16))
+
+# 模型的 token 上限 (含 [CLS]、[SEP])，以 tokenizer 截斷，而不是以字元數截斷
+MAX_TOKENS = 512
+
+# tokenize 前先截掉遠超過 token 上限的部分，只是為了少做無用的 tokenize，不影響結果
+# (一個 token 至少對應一個字元，中文通常一個字一個 token)
+TOKENIZE_CHARS = MAX_TOKENS * 8
+
+# iter_sentiments 每次排序的範圍 (批數)，範圍越大長度越接近，但要等整個範圍算完才輸出
+SCHEDULE_WINDOW = int(os.getenv("SENTIMENT_SCHEDULE_WINDOW", 16))
+
+# 長文章模式：SENTIMENT_LONG_DOCUMENT=1 時把整篇文章切成重疊的 window 分別計算，再合併成整篇的星級分布
+# 每篇最多 SENTIMENT_MAX_WINDOWS 個 window，相鄰 window 重疊 SENTIMENT_WINDOW_OVERLAP 個 token
+LONG_DOCUMENT = os.getenv("SENTIMENT_LONG_DOCUMENT") == "1"
+MAX_WINDOWS = int(os.getenv("SENTIMENT_MAX_WINDOWS", 4))
+WINDOW_OVERLAP = int(os.getenv("SENTIMENT_WINDOW_OVERLAP", 64))
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def load_model():
+    """
+    第一次呼叫時才載入 transformers 和模型，之後共用同一份，後端依 SENTIMENT_BACKEND
+
+    return: (tokenizer, model)
+    """
+    global _model
+    with _model_lock:
+        if _model is None:
+            if BACKEND not in BACKENDS:
+                raise ValueError(f"Unknown SENTIMENT_BACKEND {BACKEND!r}, expected one of {BACKENDS}")
+
+            from transformers import BertConfig, BertTokenizerFast, BertForSequenceClassification
+
+            # Rust 實作的 tokenizer，一次處理整批文章，結果與 BertTokenizer 相同
+            tokenizer = BertTokenizerFast.from_pretrained(MODEL_NAME)
+            if BACKEND == "onnx":
+                # 已匯出時不需要載入 torch 的權重，只需要 config 中的 id2label
+                model = OnnxModel(load_onnx_session(), BertConfig.from_pretrained(MODEL_NAME))
+            else:
+                model = BertForSequenceClassification.from_pretrained(MODEL_NAME)
+                model.eval()
+                if BACKEND == "int8":
+                    model = quantize_int8(model)
+            _model = (tokenizer, model)
+            print(f"Sentiment model {MODEL_NAME} loaded ({BACKEND})")
+    return _model
+
+
+def quantize_int8(model):
+    """
+    以 torch dynamic quantization 把 Linear 層 (佔 BERT 大部分的計算) 的權重轉成 INT8，
+    activation 在推論時才動態量化；embedding 和 LayerNorm 維持 fp32
+    """
+    import warnings
+    import torch
+    from torch.ao.quantization import quantize_dynamic
+
+    with warnings.catch_warnings():
+        # 新版 torch 對 torch.ao.quantization 顯示 DeprecationWarning，功能不變
+        warnings.simplefilter("ignore")
+        # inplace 以免同時存在 fp32 和 INT8 兩份模型
+        return quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def onnx_path():
+    """MODEL_NAME 匯出的 ONNX 檔路徑，每個模型一個目錄"""
+    name = re.sub(r"[^\w.-]+", "_", MODEL_NAME.strip("/\\"))
+    return os.path.join(ONNX_DIR, name, "model.onnx")
+
+
+def export_onnx(path):
+    """
+    把 MODEL_NAME 的 fp32 模型匯出成 ONNX，batch 大小和序列長度都是動態的
+    先寫到暫存檔再改名，中斷時不會留下不完整的檔案
+    """
+    import warnings
+    import torch
+    from transformers import BertForSequenceClassification
+
+    model = BertForSequenceClassification.from_pretrained(MODEL_NAME)
+    model.eval()
+    sample = torch.ones(2, 8, dtype=torch.long)
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in ONNX_INPUTS}
+    dynamic_axes["logits"] = {0: "batch"}
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with warnings.catch_warnings():
+        # TorchScript 的匯出方式 (dynamo=False) 在新版 torch 會顯示 DeprecationWarning 和 TracerWarning，結果不受影響
+        warnings.simplefilter("ignore")
+        torch.onnx.export(
+            model,
+            (sample, torch.ones_like(sample), torch.zeros_like(sample)),
+            temp_path,
+            input_names=list(ONNX_INPUTS),
+            output_names=["logits"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+            dynamo=False,
+        )
+    os.replace(temp_path, path)
+
+
+def load_onnx_session(path=None, threads=None):
+    """
+    載入匯出的 ONNX 模型，還沒匯出時先匯出
+    threads: intra-op 執行緒數，預設 SENTIMENT_ONNX_THREADS
+
+    return: onnxruntime.InferenceSession
+    """
+    import onnxruntime
+
+    path = path or onnx_path()
+    if not os.path.exists(path):
+        print(f"Exporting {MODEL_NAME} to {path}")
+        export_onnx(path)
+
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = ONNX_THREADS if threads is None else threads
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+
+class OnnxModel:
+    """以 onnxruntime 執行匯出的模型，呼叫方式與 BertForSequenceClassification 相同 (model(**inputs).logits)"""
+
+    def __init__(self, session, config):
+        self.session = session
+        self.config = config
+
+    def __call__(self, **inputs):
+        import numpy as np
+        import torch
+
+        input_ids = inputs["input_ids"].numpy()
+        feed = {
+            "input_ids": input_ids,
+            "attention_mask": np.ones_like(input_ids),
+            "token_type_ids": np.zeros_like(input_ids),
+        }
+        for name in ONNX_INPUTS:
+            if name in inputs:
+                feed[name] = inputs[name].numpy()
+        logits = self.session.run(["logits"], feed)[0]
+        return SimpleNamespace(logits=torch.from_numpy(logits))
+
+
+def star_to_emotion(star):
+    """根據星級設定情緒類型 (1: positive, 0: neutral, -1: negative)"""
+    if star in [1, 2]:
+        return -1  # negative
+    elif star == 3:
+        return 0  # neutral
+    return 1  # positive
+
+
+class PaddingStats:
+    """累計送進模型的實際 token 數和補齊後的 token 數"""
+
+    def __init__(self):
+        self.sequences = 0
+        self.batches = 0
+        self.tokens = 0
+        self.padded_tokens = 0
+
+    def add(self, lengths):
+        """記錄一批，lengths 為這批每個序列 (文章或長文章的一個 window) 的 token 數"""
+        self.sequences += len(lengths)
+        self.batches += 1
+        self.tokens += sum(lengths)
+        self.padded_tokens += max(lengths) * len(lengths)
+
+    @property
+    def overhead(self):
+        """補齊的 [PAD] 佔實際 token 數的比例，0.5 表示多算了 50% 的 token"""
+        return self.padded_tokens / self.tokens - 1 if self.tokens else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.sequences} sequences in {self.batches} batches, "
+            f"{self.tokens} tokens, {self.padded_tokens} with padding (overhead {self.overhead:.1%})"
+        )
+
+
+def tokenize(texts):
+    """
+    以 tokenizer 截斷到 MAX_TOKENS
+
+    return: list of input_ids (含 [CLS]、[SEP])
+    """
+    if not texts:
+        return []
+    tokenizer, _ = load_model()
+    return tokenizer(
+        [text[:TOKENIZE_CHARS] for text in texts], truncation=True, max_length=MAX_TOKENS
+    )["input_ids"]
+
+
+def pick_windows(count, max_windows):
+    """超過 max_windows 個 window 時平均挑選，保留第一個和最後一個"""
+    if count <= max_windows:
+        return list(range(count))
+    if max_windows == 1:
+        return [0]
+    return sorted({round(i * (count - 1) / (max_windows - 1)) for i in range(max_windows)})
+
+
+def tokenize_windows(texts, max_windows=None, overlap=None):
+    """
+    長文章模式：每篇文章切成多個重疊的 window，每個 window 最多 MAX_TOKENS (含 [CLS]、[SEP])
+    max_windows: 每篇文章最多計算的 window 數，超過時平均挑選，讓成本有上限
+    overlap: 相鄰 window 重疊的 token 數
+
+    return: (list of input_ids, 每個 window 屬於第幾篇文章)
+    """
+    if not texts:
+        return [], []
+    max_windows = max_windows or MAX_WINDOWS
+    overlap = WINDOW_OVERLAP if overlap is None else overlap
+    tokenizer, _ = load_model()
+
+    # 超過 max_windows 時會平均挑選，所以整篇文章都要 tokenize
+    encoded = tokenizer(
+        texts,
+        truncation=True,
+        max_length=MAX_TOKENS,
+        stride=overlap,
+        return_overflowing_tokens=True,
+    )
+    windows_of = {}
+    for window, owner in enumerate(encoded["overflow_to_sample_mapping"]):
+        windows_of.setdefault(owner, []).append(window)
+
+    input_ids, owners = [], []
+    for owner in range(len(texts)):
+        windows = windows_of.get(owner, [])
+        for i in pick_windows(len(windows), max_windows):
+            input_ids.append(encoded["input_ids"][windows[i]])
+            owners.append(owner)
+    return input_ids, owners
+
+
+def plan_batches(lengths, batch_size=None, sort_by_length=True):
+    """
+    依 token 長度排序後分批，長度相同時維持原本的順序
+
+    return: list of 每一批的 index
+    """
+    batch_size = batch_size or BATCH_SIZE
+    order = list(range(len(lengths)))
+    if sort_by_length:
+        order.sort(key=lengths.__getitem__)
+    return [order[start : start + batch_size] for start in range(0, len(order), batch_size)]
+
+
+def predict_probs(batch):
+    """
+    一批已 tokenize 的序列送進模型一次，補齊到這批中最長的序列
+    batch: list of input_ids
+
+    return: list of 每個序列 1 到 5 星的機率
+    """
+    import torch
+
+    tokenizer, model = load_model()
+    inputs = tokenizer.pad({"input_ids": batch}, padding=True, return_tensors="pt")
+    with torch.inference_mode():
+        probs = torch.softmax(model(**inputs).logits, dim=-1)
+
+    # 模型輸出的順序依 id2label，例如 {0: "1 star", ..., 4: "5 stars"}，轉成依星級排列
+    stars = [int(model.config.id2label[label].split()[0]) for label in range(probs.shape[-1])]
+    order = sorted(range(len(stars)), key=stars.__getitem__)
+    return probs[:, order].tolist()
+
+
+def to_result(star_probs):
+    """由 1 到 5 星的機率決定星級 (機率最高者) 和置信度分數"""
+    star = max(range(len(star_probs)), key=star_probs.__getitem__) + 1
+    return {
+        "score": star_probs[star - 1],  # 置信度分數 (浮點數)
+        "star": star,  # 星級 (1 到 5)
+        "emotion": star_to_emotion(star),  # 情緒類型 (1: positive, 0: neutral, -1: negative)
+        "star_probs": star_probs,  # 1 到 5 星的機率
+    }
+
+
+def analyze_texts(texts, batch_size=None, sort_by_length=True, stats=None, long_document=None):
+    """
+    分析多篇文章，所有序列依 token 長度分批，每 batch_size 個送進模型一次，某一批失敗時不影響其他批
+    long_document: 是否使用長文章模式，預設依 SENTIMENT_LONG_DOCUMENT；
+                   長文章模式以每個 window 的 token 數加權平均各星級的機率，得到整篇文章的分布
+    stats: PaddingStats，記錄每一批的補齊情況
+
+    return: list of (result dict 或 None, 錯誤訊息或 None)，順序與 texts 相同
+    """
+    if long_document is None:
+        long_document = LONG_DOCUMENT
+    if long_document:
+        encoded, owners = tokenize_windows(texts)
+    else:
+        encoded = tokenize(texts)
+        owners = list(range(len(texts)))
+    lengths = [len(input_ids) for input_ids in encoded]
+
+    totals = [None] * len(texts)  # 加權後的機率總和
+    weights = [0] * len(texts)
+    errors = [None] * len(texts)
+    for indices in plan_batches(lengths, batch_size, sort_by_length):
+        if stats is not None:
+            stats.add([lengths[i] for i in indices])
+        try:
+            batch_probs = predict_probs([encoded[i] for i in indices])
+        except Exception as e:
+            for i in indices:
+                errors[owners[i]] = str(e)
+            continue
+        for i, probs in zip(indices, batch_probs):
+            owner = owners[i]
+            weighted = [p * lengths[i] for p in probs]
+            totals[owner] = weighted if totals[owner] is None else [
+                total + p for total, p in zip(totals[owner], weighted)
+            ]
+            weights[owner] += lengths[i]
+
+    outcomes = []
+    for total, weight, error in zip(totals, weights, errors):
+        if error is not None:
+            outcomes.append((None, error))
+        else:
+            outcomes.append((to_result([p / weight for p in total]), None))
+    return outcomes
+
+
+def analyze_batch(texts, batch_size=None, sort_by_length=True, stats=None, long_document=None):
+    """
+    分析多篇文章 (見 analyze_texts)，任何一批失敗時拋出例外
+    texts: list of string 文章內容
+
+    return: list of dict，順序與 texts 相同，每個 dict 包含
+            score (置信度分數)、star (1 到 5)、emotion (1: positive, 0: neutral, -1: negative)、
+            star_probs (1 到 5 星的機率)
+    """
+    results = []
+    for result, error in analyze_texts(texts, batch_size, sort_by_length, stats, long_document):
+        if error is not None:
+            raise RuntimeError(error)
+        results.append(result)
+    return results
+
+
+def iter_sentiments(news_list, batch_size=None, long_document=None):
+    """
+    依序分析多篇新聞的 content，每 SCHEDULE_WINDOW 批的新聞一起依長度排序後分批送進模型
+    沒有 content 或所在的那一批推論失敗時，result 為 None、error 為錯誤訊息
+    全部完成後印出補齊的 token 比例
+
+    yield: (news, result, error)，順序與 news_list 相同
+    """
+    batch_size = batch_size or BATCH_SIZE
+    window = batch_size * SCHEDULE_WINDOW
+    stats = PaddingStats()
+
+    for start in range(0, len(news_list), window):
+        chunk = news_list[start : start + window]
+        outcomes = [(None, "no content")] * len(chunk)
+
+        with_content = [i for i, news in enumerate(chunk) if news.get("content")]
+        try:
+            analyzed = analyze_texts(
+                [chunk[i]["content"] for i in with_content],
+                batch_size,
+                stats=stats,
+                long_document=long_document,
+            )
+            for i, outcome in zip(with_content, analyzed):
+                outcomes[i] = outcome
+        except Exception as e:
+            # tokenize 失敗，這個範圍內有 content 的新聞都標記為失敗
+            for i in with_content:
+                outcomes[i] = (None, str(e))
+
+        for news, (result, error) in zip(chunk, outcomes):
+            yield news, result, error
+
+    if stats.batches:
+        print(f"Sentiment inference: {stats}")
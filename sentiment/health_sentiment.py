@@ -1,65 +1,51 @@
 import asyncio
-from transformers import BertTokenizer, BertForSequenceClassification, pipeline
 from supabase import create_client, Client
 from dotenv import load_dotenv
 import os
+import sys
 import matplotlib.pyplot as plt
 
+# 讓直接執行這個檔案時也能 import 專案根目錄的 rollup.py 和 sentiment/bert_model.py
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rollup import record_sentiment, db_index_for_url
+from aggregation import EMOTION_LABELS
+from sentiment.bert_model import analyze_batch, iter_sentiments
+
 # 加載 .env 文件，確保 SUPABASE_URL 和 SUPABASE_KEY 被正確讀取
 load_dotenv()
 
-# 配置情緒分析模型 (使用 nlptown/bert-base-multilingual-uncased-sentiment 模型)
-model_name = "nlptown/bert-base-multilingual-uncased-sentiment"
-model = BertForSequenceClassification.from_pretrained(model_name)
-tokenizer = BertTokenizer.from_pretrained(model_name)
-
-# 創建情緒分析 pipeline
-sentiment_analyzer = pipeline("sentiment-analysis", model=model, tokenizer=tokenizer)
+# 情緒分析模型 (nlptown/bert-base-multilingual-uncased-sentiment) 的載入和批次推論見 bert_model.py
 
 # Supabase 資訊
 url: str = os.getenv("SUPABASE_URL")
 key: str = os.getenv("SUPABASE_KEY")
 supabase: Client = create_client(url, key)
 
+# 寫入的是資料庫 1 還是 2，用來更新每日彙總表；.env 的 SUPABASE_URL 不是兩者之一時不更新
+db_index = db_index_for_url(url)
+
 # 統計數據存儲
 emotion_counts = {"positive": 0, "neutral": 0, "negative": 0}
 star_counts = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
 
 
+def count_sentiment(result):
+    """統計情緒類型和星級"""
+    emotion_counts[EMOTION_LABELS[result["emotion"]]] += 1
+    star_counts[result["star"]] += 1
+
+
 def bert_sentiment_analysis(news):
     """
     使用 nlptown 的多語言 BERT 模型進行情緒分析
     news: string 文章內容
+    多篇文章請使用 bert_model.analyze_batch 或 iter_sentiments 一起送進模型
 
     return: dict 包含 sentiment_score, star, 和 emotion (1: positive, 0: neutral, -1: negative)
     """
-    result = sentiment_analyzer(news[:512])[0]  # 模型有 token 限制，這裡截取前512個字元
-    sentiment_label = result["label"]  # 例如 "5 stars"
-    sentiment_score = result["score"]  # 置信度分數
-
-    # 提取星級數字，例如 "5 stars" -> 5
-    star = int(sentiment_label.split()[0])
-
-    # 根據星級設定情緒類型
-    if star in [1, 2]:
-        emotion = -1  # negative
-        emotion_label = "negative"
-    elif star == 3:
-        emotion = 0  # neutral
-        emotion_label = "neutral"
-    else:
-        emotion = 1  # positive
-        emotion_label = "positive"
-
-    # 統計情緒類型和星級
-    emotion_counts[emotion_label] += 1
-    star_counts[star] += 1
-
-    return {
-        "score": sentiment_score,  # 置信度分數 (浮點數)
-        "star": star,  # 星級 (1 到 5)
-        "emotion": emotion,  # 情緒類型 (1: positive, 0: neutral, -1: negative)
-    }
+    result = analyze_batch([news])[0]
+    count_sentiment(result)
+    return result
 
 
 async def fetch_all_data(table_name, batch_size=1000):
@@ -103,12 +89,15 @@ async def analyze_and_store_sentiments():
         print("No news data found in health_news.")
         return
 
-    for news in news_data:
+    # 進行情緒分析，每 SENTIMENT_BATCH_SIZE 篇文章一起送進模型
+    for news, sentiment_result, error in iter_sentiments(news_data):
+        if error is not None:
+            print(f"Failed to process news ID {news['id']}. Error: {error}")
+            continue
         try:
             print(f"Processing news ID: {news['id']}")
+            count_sentiment(sentiment_result)
 
-            # 進行情緒分析
-            sentiment_result = bert_sentiment_analysis(news["content"])
             sentiment_score = sentiment_result["score"]
             star = sentiment_result["star"]
             emotion = sentiment_result["emotion"]
@@ -142,6 +131,12 @@ async def analyze_and_store_sentiments():
             # 使用 response.data 確認是否成功插入數據
             if insert_response.data:
                 print(f"Successfully inserted sentiment for news ID: {news['id']}")
+                # 同步更新每日彙總表 (rollup.py)，同一篇新聞重複寫入只會計算一次
+                if db_index is not None:
+                    try:
+                        record_sentiment("health", db_index, news, sentiment_score, star, emotion)
+                    except Exception as e:
+                        print(f"Failed to update rollup for news ID {news['id']}: {str(e)}")
             else:
                 print(
                     f"Failed to insert sentiment for news ID {news['id']}. Response: {insert_response}"
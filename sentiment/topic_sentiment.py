@@ -1,72 +1,23 @@
 import asyncio
-from supabase import create_client
-from transformers import BertTokenizer, BertForSequenceClassification, pipeline
-from supabase import create_client, Client
-from dotenv import load_dotenv
-import os
-import matplotlib.pyplot as plt
-
-# 加載 .env 文件，確保 SUPABASE_URL 和 SUPABASE_KEY 被正確讀取
-load_dotenv()
-
-# 配置情緒分析模型 (使用 nlptown/bert-base-multilingual-uncased-sentiment 模型)
-model_name = "nlptown/bert-base-multilingual-uncased-sentiment"
-model = BertForSequenceClassification.from_pretrained(model_name)
-tokenizer = BertTokenizer.from_pretrained(model_name)
-
-# 創建情緒分析 pipeline
-sentiment_analyzer = pipeline("sentiment-analysis", model=model, tokenizer=tokenizer)
-
-# Supabase 資訊
-# Supabase info for Database 1
-url1 = os.getenv("SUPABASE_URL_1")
-key1 = os.getenv("SUPABASE_KEY_1")
-supabase1 = create_client(url1, key1)
-
-# Supabase info for Database 2
-url2 = os.getenv("SUPABASE_URL_2")
-key2 = os.getenv("SUPABASE_KEY_2")
-supabase2 = create_client(url2, key2)
-
-# 統計數據存儲
-emotion_counts = {"positive": 0, "neutral": 0, "negative": 0}
-star_counts = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
+from cache import invalidate_topic
+from db import iter_keyset_pages, fetch_in, get_clients
+from rollup import record_sentiment
 
+# 情緒分析模型 (nlptown/bert-base-multilingual-uncased-sentiment) 的載入和批次推論見 bert_model.py，
+# 第一次分析時才載入模型
+from sentiment.bert_model import analyze_batch, iter_sentiments
 
 def bert_sentiment_analysis(news):
     """
     使用 nlptown 的多語言 BERT 模型進行情緒分析
     news: string 文章內容
+    多篇文章請使用 bert_model.analyze_batch 或 iter_sentiments 一起送進模型
 
     return: dict 包含 sentiment_score, star, 和 emotion (1: positive, 0: neutral, -1: negative)
     """
-    result = sentiment_analyzer(news[:512])[0]  # 模型有 token 限制，這裡截取前512個字元
-    sentiment_label = result["label"]  # 例如 "5 stars"
-    sentiment_score = result["score"]  # 置信度分數
-
-    # 提取星級數字，例如 "5 stars" -> 5
-    star = int(sentiment_label.split()[0])
-
-    # 根據星級設定情緒類型
-    if star in [1, 2]:
-        emotion = -1  # negative
-        emotion_label = "negative"
-    elif star == 3:
-        emotion = 0  # neutral
-        emotion_label = "neutral"
-    else:
-        emotion = 1  # positive
-        emotion_label = "positive"
-
-    # 統計情緒類型和星級
-    emotion_counts[emotion_label] += 1
-    star_counts[star] += 1
-
-    return {
-        "score": sentiment_score,  # 置信度分數 (浮點數)
-        "star": star,  # 星級 (1 到 5)
-        "emotion": emotion,  # 情緒類型 (1: positive, 0: neutral, -1: negative)
-    }
+    # 這個模組在 web server 的多個請求執行緒中執行，不維護模組層級的統計數據
+    # (各 topic 的腳本 stock_sentiment.py 等仍會統計並畫圖)
+    return analyze_batch([news])[0]
 
 
 ####################### [date版本] ############################
@@ -77,57 +28,70 @@ async def fetch_data_within_date(
 ):
     """
     分批次從 Supabase 表中提取在指定日期範圍內的數據，直到提取完成。
+    每筆資料加上 db_index (1 或 2)，標記來自哪個資料庫
     """
     all_data = []
 
     # 遍歷 supabase1 和 supabase2 數據庫
-    for db_index, supabase in enumerate([supabase1, supabase2], start=1):
+    for db_index, supabase in enumerate(get_clients(), start=1):
         # 遍歷 "news" 表
         for table_suffix in ["news"]:
             table_name = f"{topic}_{table_suffix}"
-            offset = 0
 
-            while True:
+            def build_query():
                 # 構建查詢並篩選日期範圍
                 query = (
                     supabase.from_(table_name)
                     .select("*")  # 取得所需欄位
                     .gte("date", start_date)
                     .lte("date", end_date)
-                    .range(offset, offset + batch_size - 1)
                 )
 
                 # 如果 source 參數不是 "all"，則進行來源篩選
                 if source != "all":
                     query = query.eq("source", source)
+                return query
 
-                # 執行查詢
-                response = query.execute()
-                data = response.data
-
-                # 檢查是否有數據
-                if not data:
-                    print(
-                        f"No more data in {table_name} for date range {start_date} to {end_date}."
-                    )
-                    break
-
-                # 如果返回 None，則說明發生錯誤
-                if data is None:
-                    print(f"Error fetching data from table: {table_name}")
-                    break
-
+            # 以 keyset (id > 上一頁最後的 id ORDER BY id) 分頁，每一頁的成本不會隨頁數增加
+            for data in iter_keyset_pages(build_query, batch_size):
                 # 將數據添加到 all_data 中
+                for news in data:
+                    news["db_index"] = db_index
                 all_data.extend(data)
-                offset += batch_size
 
                 print(
                     f"Fetched {len(data)} records from {table_name} in supabase{db_index} for date range {start_date} to {end_date}, total so far: {len(all_data)}"
                 )
 
+            print(
+                f"No more data in {table_name} for date range {start_date} to {end_date}."
+            )
+
     return all_data
 
 
+def fetch_rollup_news(supabase, topic, news_ids):
+    """
+    Database 2 中 id 為 news_ids 的新聞 (不限日期、來源)，讀取情緒時 news_id 對應的就是這一筆：
+    `{topic}_news` 優先，沒有時才用 `{topic}_news_API` (見 utils.fetch_news_rows)
+
+    return: dict {id: 含 id、date、source 的新聞}
+    """
+    rows = {}
+    for table_suffix in ["news", "news_API"]:
+        table_name = f"{topic}_{table_suffix}"
+        remaining = sorted(set(news_ids) - rows.keys())
+        if not remaining:
+            break
+
+        def build_query(table_name=table_name):
+            return supabase.from_(table_name).select("id", "date", "source")
+
+        for row in fetch_in(build_query, "id", remaining):
+            rows.setdefault(row["id"], row)
+    return rows
+
+
 async def analyze_and_store_sentiments(topic, start_date, end_date, source):
     print("即時情緒分析中!")
 
@@ -137,25 +101,48 @@ async def analyze_and_store_sentiments(topic, start_date, end_date, source):
         print(f"No news data found in {source} for the given date range.")
         return
 
-    for news in news_data:
-        try:
-            # 檢查該 news_id 是否已存在於 {topic}_news_sentiment 表中
-            existing_sentiment = (
-                supabase2.from_(f"{topic}_news_sentiment")
-                .select("id")
-                .eq("news_id", news["id"])
-                .execute()
-            )
+    # 情緒結果寫入 Database 2
+    supabase2 = get_clients()[1]
 
-            # 如果該新聞的 sentiment 已存在，跳過分析
-            if existing_sentiment.data:
-                print(f"Skipping news ID {news['id']} - sentiment already exists.")
-                continue
+    # 一次查詢哪些 news_id 已存在於 {topic}_news_sentiment 表中
+    def build_query():
+        return supabase2.from_(f"{topic}_news_sentiment").select("id", "news_id")
 
+    try:
+        existing_ids = {
+            row["news_id"]
+            for row in fetch_in(build_query, "news_id", sorted({news["id"] for news in news_data}))
+        }
+    except Exception as e:
+        print(f"Failed to check existing sentiments. Error: {str(e)}")
+        return
+
+    # 如果該新聞的 sentiment 已存在，跳過分析；同一個 id 只分析一次。
+    # 兩個資料庫有相同的 id 時先分析 Database 2 的新聞，讀取時情緒對應的是 Database 2 的新聞
+    pending = []
+    for news in sorted(news_data, key=lambda news: news["db_index"] != 2):
+        if news["id"] in existing_ids:
+            print(f"Skipping news ID {news['id']} - sentiment already exists.")
+            continue
+        existing_ids.add(news["id"])
+        pending.append(news)
+
+    # 每日彙總表 (rollup.py) 以讀取時對應到的 Database 2 新聞計入，日期和來源也取自這一筆；
+    # Database 2 沒有這個 id 的新聞時，讀取時不會用到這筆情緒，也不計入彙總表
+    try:
+        rollup_news = fetch_rollup_news(supabase2, topic, [news["id"] for news in pending])
+    except Exception as e:
+        print(f"Failed to look up news for the rollup, run rollup.py repair afterwards. Error: {str(e)}")
+        rollup_news = {}
+
+    # 進行情緒分析，每 SENTIMENT_BATCH_SIZE 篇文章一起送進模型
+    for news, sentiment_result, error in iter_sentiments(pending):
+        if error is not None:
+            print(f"Failed to process news ID {news['id']}. Error: {error}")
+            continue
+        try:
             print(f"Processing news ID: {news['id']}")
 
-            # 進行情緒分析
-            sentiment_result = bert_sentiment_analysis(news["content"])
             sentiment_score = sentiment_result["score"]
             star = sentiment_result["star"]
             emotion = sentiment_result["emotion"]
@@ -181,6 +168,14 @@ async def analyze_and_store_sentiments(topic, start_date, end_date, source):
             # 使用 response.data 確認是否成功插入數據
             if insert_response.data:
                 print(f"Successfully inserted sentiment for news ID: {news['id']}")
+                # 新的情緒資料會影響搜尋結果，讓該 topic 的快取失效
+                invalidate_topic(topic)
+                # 同步更新每日彙總表 (rollup.py)，同一篇新聞重複寫入只會計算一次
+                try:
+                    if news["id"] in rollup_news:
+                        record_sentiment(topic, 2, rollup_news[news["id"]], sentiment_score, star, emotion)
+                except Exception as e:
+                    print(f"Failed to update rollup for news ID {news['id']}: {str(e)}")
             else:
                 print(
                     f"Failed to insert sentiment for news ID {news['id']}. Response: {insert_response}"
@@ -1,293 +1,467 @@
 # utils.py
-from supabase import create_client
-from dotenv import load_dotenv
+# pandas、matplotlib 和情緒分析模型 (sentiment.topic_sentiment) 在函數中第一次用到時才載入，
+# 啟動 app 和只使用搜尋、爬蟲的請求不需要等待這些套件
 import os
-import matplotlib.pyplot as plt
 from io import BytesIO
 import base64
-import pandas as pd
-import importlib
+import numpy as np
+import asyncio
 from datetime import datetime
-from sentiment.topic_sentiment import analyze_and_store_sentiments  # Adjusted import
-
-# Load environment variables
-load_dotenv()
-
-# Supabase info for Database 1
-url1 = os.getenv("SUPABASE_URL_1")
-key1 = os.getenv("SUPABASE_KEY_1")
-supabase1 = create_client(url1, key1)
-
-# Supabase info for Database 2
-url2 = os.getenv("SUPABASE_URL_2")
-key2 = os.getenv("SUPABASE_KEY_2")
-supabase2 = create_client(url2, key2)
-
-emotion_counts = {"positive": 0, "neutral": 0, "negative": 0}
-star_counts = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
-
-
-def fetch_news_ids(topic, start_date, end_date, source, batch_size=5000):
-    # 從 `{topic}_news` 和 `{topic}_news_API` 兩個資料表中篩選符合條件的數據
-    news_ids = set()
-    for db_index, supabase in enumerate([supabase1, supabase2], start=1):
-        for table_suffix in ["news", "news_API"]:
-            table_name = f"{topic}_{table_suffix}"
-            offset = 0
-            while True:
-                query = (
-                    supabase.from_(table_name)
-                    .select("id")
-                    .gte("date", start_date)
-                    .lte("date", end_date)
-                    .range(offset, offset + batch_size - 1)
-                )
-
-                # If source is not "all", filter by the specific source
-                if source != "all":
-                    query = query.eq("source", source)
-
-                response = query.execute()
-
-                if response.data is None:
-                    print(f"Error fetching data from table: {table_name}")
-                    break
-
-                data = response.data
-                if not data:
-                    break
-
-                # 將符合條件的新聞 ID 添加到 news_ids 集合中
-                news_ids.update((db_index, item["id"]) for item in data)
-                offset += batch_size
-    return list(news_ids)
-
-
-def fetch_sentiment_data(news_ids, topic, batch_size=5000):
+from functools import cached_property
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from aggregation import SentimentAggregate, aggregate_sentiments, resample_daily, ROLLING_WINDOWS
+from db import fetch_sharded, fetch_in, get_clients
+import rollup
+
+# 新聞資料表只需要讀取這些欄位，統計和時間序列圖都夠用
+NEWS_COLUMNS = ["id", "date", "source"]
+
+
+def fetch_news_rows(topic, start_date, end_date, source, batch_size=5000, count="exact"):
+    """
+    從兩個資料庫的 `{topic}_news` 和 `{topic}_news_API` 篩選符合條件的新聞，一次讀取 id、date、source
+    四個資料表先各自查詢筆數和 id 範圍，再把範圍切段後平行讀取 (見 db.fetch_sharded)
+    count: 傳給 plan_key_ranges，"exact" 或 "planned"
+
+    return: DataFrame，欄位為 db_index、id、date、source，
+            同一個資料庫中 id 重複時只保留 `{topic}_news` 的資料 (即使它不在條件內)
+    """
+    import pandas as pd
+
+    def query_builder(supabase, table_name):
+        def build_query(count=None):
+            query = (
+                supabase.from_(table_name)
+                .select(*NEWS_COLUMNS, count=count)
+                .gte("date", start_date)
+                .lte("date", end_date)
+            )
+
+            # If source is not "all", filter by the specific source
+            if source != "all":
+                query = query.eq("source", source)
+            return query
+
+        return build_query
+
+    # dict 的順序決定重複 id 時保留哪一筆："news" 在 "news_API" 前面
+    build_queries = {
+        (db_index, table_suffix): query_builder(supabase, f"{topic}_{table_suffix}")
+        for db_index, supabase in enumerate(get_clients(), start=1)
+        for table_suffix in ["news", "news_API"]
+    }
+    results = fetch_sharded(build_queries, shard_size=batch_size, count=count)
+
+    # 同一個 (db_index, id) 不論日期、來源是否符合條件都以 `{topic}_news` 的資料為準：情緒分析只讀取
+    # `{topic}_news` (見 sentiment/topic_sentiment.py)，情緒表的 news_id 指的是這一筆。
+    # 範圍內的 `{topic}_news_API` 新聞要另外確認 `{topic}_news` 中沒有相同的 id (可能在範圍外)，
+    # 每篇新聞因此只屬於一個日期，與每日彙總表 (rollup.py) 和依月份分段的統計一致
+    for db_index, supabase in enumerate(get_clients(), start=1):
+        api_rows = results[(db_index, "news_API")]
+        api_ids = {row["id"] for row in api_rows} - {row["id"] for row in results[(db_index, "news")]}
+        if api_ids:
+            shadowed = fetch_existing_ids(supabase, f"{topic}_news", api_ids)
+            results[(db_index, "news_API")] = [row for row in api_rows if row["id"] not in shadowed]
+
+    frames = [
+        pd.DataFrame(rows, columns=NEWS_COLUMNS).assign(db_index=db_index)
+        for (db_index, _), rows in results.items()
+    ]
+    news_rows = pd.concat(frames, ignore_index=True)[["db_index"] + NEWS_COLUMNS]
+    news_rows["id"] = news_rows["id"].astype(np.int64)  # 空的資料表會讓 id 變成 object
+    news_rows = news_rows.drop_duplicates(["db_index", "id"], keep="first")
+    return news_rows.sort_values(["db_index", "id"], ignore_index=True)
+
+
+def fetch_existing_ids(supabase, table_name, ids):
+    """ids 中存在於 table_name 的 id (不限日期、來源)"""
+
+    def build_query():
+        return supabase.from_(table_name).select("id")
+
+    return {row["id"] for row in fetch_in(build_query, "id", sorted(ids))}
+
+
+def news_ids_by_db(news_rows):
+    """
+    把 fetch_news_rows 的結果轉成每個資料庫的新聞 ID
+
+    return: dict {db_index: 排序且不重複的 numpy int64 array}
+    """
+    return {
+        db_index: np.unique(news_rows.loc[news_rows["db_index"] == db_index, "id"].to_numpy(dtype=np.int64))
+        for db_index in (1, 2)
+    }
+
+
+def fetch_news_ids(topic, start_date, end_date, source, batch_size=5000, count="exact"):
+    """
+    return: dict {db_index: 排序且不重複的 numpy int64 array}
+    """
+    return news_ids_by_db(fetch_news_rows(topic, start_date, end_date, source, batch_size, count))
+
+
+def fetch_sentiment_data(news_ids, topic, batch_size=1000):
+    """
+    讀取新聞 ID 對應的情緒資料
+    news_ids: dict {db_index: news id array}，見 news_ids_by_db
+    查詢失敗時會拋出例外，不會把失敗當成沒有資料
+
+    return: list of dict，"id", "news_id", "sentiment", "emotion", "star", "db_index"
+    """
     # 確保使用正確的情緒分析表名稱
     sentiment_table = f"{topic}_news_sentiment"
     all_sentiments = []
     fetched_ids = set()  # 記錄已抓取的 (db_index, news_id)，避免重複
 
-    for db_index, supabase in enumerate([supabase1, supabase2], start=1):
-        batch_ids = [news_id for db_id, news_id in news_ids if db_id == db_index]
+    for db_index, supabase in enumerate(get_clients(), start=1):
 
-        for i in range(0, len(batch_ids), batch_size):
-            batch = batch_ids[i : i + batch_size]
-            response = (
-                supabase.from_(sentiment_table)
-                .select("news_id", "sentiment", "emotion", "star")
-                .in_("news_id", batch)
-                .execute()
+        def build_query():
+            return supabase.from_(sentiment_table).select(
+                "id", "news_id", "sentiment", "emotion", "star"
             )
 
-            # 確認回應資料是否存在
-            if response.data:
-                for entry in response.data:
-                    id_with_db = (db_index, entry["news_id"])
-                    if id_with_db not in fetched_ids:
-                        entry["db_index"] = db_index  # 新增來源資料庫的標記
-                        all_sentiments.append(entry)
-                        fetched_ids.add(id_with_db)  # 記錄已處理的 (db_index, news_id)
+        # 依 URL 長度切段並同時查詢，連續的大量 id 改用範圍條件
+        rows = fetch_in(build_query, "news_id", news_ids[db_index].tolist(), batch_size)
+
+        for entry in rows:
+            id_with_db = (db_index, entry["news_id"])
+            if id_with_db not in fetched_ids:
+                entry["db_index"] = db_index  # 新增來源資料庫的標記
+                all_sentiments.append(entry)
+                fetched_ids.add(id_with_db)  # 記錄已處理的 (db_index, news_id)
     return all_sentiments
 
 
-# for時間序列圖
-def fetch_date_data(news_ids, topic, batch_size=5000):
-    all_dates = []
-    fetched_ids = set()  # Track fetched (db_index, news_id) to avoid duplicates
+def fetch_emotion_map(supabase, topic, news_ids, emotion_value=None, batch_size=1000):
+    """
+    一次以 in_("news_id", ...) 批次查詢一整頁新聞的情緒，取代逐筆查詢
+    與其他 in_ 查詢相同經過 db.fetch_in：依 URL 長度切段、連續的 id 改用範圍條件、每段以 keyset 分頁
+    supabase: 要查詢的 Supabase client
+    news_ids: 這一頁新聞的 id
+    emotion_value: 只保留指定情緒 (1, 0, -1)，None 表示不過濾
+    batch_size: 每一段每頁讀取的筆數
+
+    return: dict {news_id: emotion}，同一個 news_id 只保留第一筆 (情緒表 id 最小的一筆)
+    """
+    sentiment_table = f"{topic}_news_sentiment"
+
+    def build_query():
+        query = supabase.table(sentiment_table).select("id, news_id, emotion")
+
+        # 只在 emotion_value 有效的情況下加入條件
+        if emotion_value is not None:
+            query = query.eq("emotion", emotion_value)
+        return query
+
+    emotion_map = {}
+    for entry in fetch_in(build_query, "news_id", news_ids, batch_size):
+        emotion_map.setdefault(entry["news_id"], entry["emotion"])
+    return emotion_map
+
 
-    for db_index, supabase in enumerate([supabase1, supabase2], start=1):
-        batch_ids = [news_id for db_id, news_id in news_ids if db_id == db_index]
+class AnalysisContext:
+    """
+    一次 /analyze 請求的資料：同一組 (topic, 日期範圍, source) 的新聞 ID、日期和情緒
+    只在第一次用到時抓取一次，統計和兩張圖表都共用這份資料
+    use_rollup: 這個 topic 已建立每日彙總表 (rollup.py) 時直接讀取彙總表，不讀取原始資料
+    """
 
-        for i in range(0, len(batch_ids), batch_size):
-            batch = batch_ids[i : i + batch_size]
+    def __init__(self, topic, start_date, end_date, source, use_rollup=False):
+        self.topic = topic
+        self.start_date = start_date
+        self.end_date = end_date
+        self.source = source
+        self.use_rollup = use_rollup
+
+    @cached_property
+    def rollup_daily(self):
+        # 每日彙總表中這段期間的統計，沒有使用或還沒建立彙總表時為 None
+        if not self.use_rollup or not rollup.is_built(self.topic):
+            return None
+        return rollup.query_daily(self.topic, self.start_date, self.end_date, self.source)
+
+    @cached_property
+    def news_rows(self):
+        # 一次讀取 "db_index", "id", "date", "source"，時間序列圖不用再回頭查日期
+        return fetch_news_rows(self.topic, self.start_date, self.end_date, self.source)
+
+    @cached_property
+    def news_ids(self):
+        return news_ids_by_db(self.news_rows)
+
+    @cached_property
+    def sentiment_data(self):
+        # "news_id", "sentiment", "emotion", "star", "db_index"
+        return fetch_sentiment_data(self.news_ids, self.topic)
+
+    @cached_property
+    def aggregate(self):
+        if self.rollup_daily is not None:
+            return rollup.daily_aggregate(self.rollup_daily)
+        return aggregate_sentiments(self.sentiment_data)
+
+    @cached_property
+    def daily_stats(self):
+        """每日平均 sentiment 和筆數 (index 為日期，欄位 mean、count)"""
+        if self.rollup_daily is not None:
+            return rollup.daily_stats(self.rollup_daily)
+
+        import pandas as pd
+
+        # Convert lists to DataFrames for easier merging
+        sentiment_data_df = pd.DataFrame(
+            self.sentiment_data, columns=["db_index", "news_id", "sentiment", "emotion", "star"]
+        )
 
-            # Loop through table suffixes
-            for table_suffix in ["news", "news_API"]:
-                table_name = f"{topic}_{table_suffix}"
+        # 兩個資料庫的 id 各自獨立，合併時要同時比對 db_index
+        combined_data = pd.merge(
+            self.news_rows,
+            sentiment_data_df,
+            left_on=["db_index", "id"],
+            right_on=["db_index", "news_id"],
+            how="inner",
+        )
 
-                # Query the current table
-                response = (
-                    supabase.from_(table_name)
-                    .select("id", "date")
-                    .in_("id", batch)
-                    .execute()
-                )
+        # Convert the date column to datetime format and sort by date
+        combined_data["date"] = pd.to_datetime(combined_data["date"])
+        combined_data = combined_data.sort_values("date")
 
-                # Process response
-                if response.data:
-                    for entry in response.data:
-                        id_with_db = (db_index, entry["id"])
-                        if id_with_db not in fetched_ids:
-                            entry["db_index"] = db_index  # 新增來源資料庫的標記
-                            all_dates.append(entry)
-                            fetched_ids.add(id_with_db)
+        # Calculate the daily average sentiment score
+        return combined_data.groupby("date")["sentiment"].agg(["mean", "count"])
 
-    return all_dates
+    @property
+    def daily_sentiment(self):
+        """每日平均 sentiment (index 為日期)"""
+        return self.daily_stats["mean"]
 
 
 # from database
-def analyze_data(topic, start_date, end_date, source):
-    global emotion_counts, star_counts
-    emotion_counts = {"positive": 0, "neutral": 0, "negative": 0}
-    star_counts = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
+def analyze_data(topic, start_date, end_date, source, context=None):
+    """
+    從資料庫已儲存的情緒資料計算分布
 
+    return: SentimentAggregate
+    """
     # 抓取符合條件的新聞 ID 和對應情緒數據
-    news_ids = fetch_news_ids(topic, start_date, end_date, source)
-    sentiment_data = fetch_sentiment_data(news_ids, topic)
-
-    # 分析資料並累積計數，同時列印每個 ID 的情緒和星級
-    for entry in sentiment_data:
-        db_index = entry["db_index"]
-        news_id = entry["news_id"]
-        star = entry["star"]
-        emotion = entry["emotion"]
-
-        # 列印每筆資料的來源資料庫、ID、star 和 emotion
-        print(
-            f"Database: {db_index}, News ID: {news_id}, Star: {star}, Emotion: {emotion}"
-        )
+    if context is None:
+        context = AnalysisContext(topic, start_date, end_date, source)
 
-        # 累計 star 和 emotion 計數
-        star_counts[star] += 1
-        if emotion == 1:
-            emotion_counts["positive"] += 1
-        elif emotion == 0:
-            emotion_counts["neutral"] += 1
-        elif emotion == -1:
-            emotion_counts["negative"] += 1
+    # 分析資料並累積計數 (已建立彙總表時直接加總每日統計)
+    aggregate = context.aggregate
     print("analyze_data計算完成!")
+    return aggregate
 
 
 # from {topic}_sentiment.py
-def analyze_realtime(topic, start_date, end_date, source):
+def analyze_realtime(topic, start_date, end_date, source, context=None):
     """
     根據選擇的主題，調用 sentiment 資料夾下對應的情緒分析模組
     topic: 主題（health、sport 或 stock）
     start_date, end_date: 分析的開始與結束日期
     source: 資料來源
-    """
+    context: AnalysisContext，必須在情緒分析寫入後才第一次讀取資料
 
-    global emotion_counts, star_counts
-    emotion_counts = {"positive": 0, "neutral": 0, "negative": 0}
-    star_counts = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
+    return: SentimentAggregate
+    """
 
     # 直接調用 topic_sentiment.py 的 analyze_and_store_sentiments 函數
+    # 第一次即時分析時才載入 sentiment.topic_sentiment (以及它使用的 BERT 模型)
+    from sentiment.topic_sentiment import analyze_and_store_sentiments
+
     print("即時情緒分析中!")
-    result = analyze_and_store_sentiments(topic, start_date, end_date, source)
+    result = asyncio.run(
+        analyze_and_store_sentiments(topic, start_date, end_date, source)
+    )
     print("即時情緒分析完成!")
 
     # 抓取符合條件的新聞 ID 和對應情緒數據
-    news_ids = fetch_news_ids(topic, start_date, end_date, source)
-    sentiment_data = fetch_sentiment_data(news_ids, topic)
-
-    # 分析資料並累積計數，同時列印每個 ID 的情緒和星級
-    for entry in sentiment_data:
-        db_index = entry["db_index"]
-        news_id = entry["news_id"]
-        star = entry["star"]
-        emotion = entry["emotion"]
-
-        # 列印每筆資料的來源資料庫、ID、star 和 emotion
-        print(
-            f"Database: {db_index}, News ID: {news_id}, Star: {star}, Emotion: {emotion}"
-        )
+    if context is None:
+        context = AnalysisContext(topic, start_date, end_date, source)
 
-        # 累計 star 和 emotion 計數
-        star_counts[star] += 1
-        if emotion == 1:
-            emotion_counts["positive"] += 1
-        elif emotion == 0:
-            emotion_counts["neutral"] += 1
-        elif emotion == -1:
-            emotion_counts["negative"] += 1
+    # 分析資料並累積計數
+    aggregate = aggregate_sentiments(context.sentiment_data)
     print("analyze_realtime計算完成!")
+    return aggregate
+
+
+# /analyze_stream 同時處理的月份數，每個月份內的查詢另外使用 db.fetch_executor
+SHARD_WORKERS = int(os.getenv("ANALYZE_SHARD_WORKERS", 4))
+shard_executor = ThreadPoolExecutor(max_workers=SHARD_WORKERS, thread_name_prefix="analyze_shard")
+
+
+def month_shards(start_date, end_date):
+    """
+    把 [start_date, end_date] 切成每個月一段，第一段和最後一段截到實際的開始和結束日期
+
+    return: [(開始日期, 結束日期), ...]，日期格式 YYYY-MM-DD
+    """
+    import pandas as pd
 
+    start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    shards = []
+    for period in pd.period_range(start, end, freq="M"):
+        shard_start = max(period.start_time, start)
+        shard_end = min(period.end_time.normalize(), end)
+        shards.append((shard_start.strftime("%Y-%m-%d"), shard_end.strftime("%Y-%m-%d")))
+    return shards
 
-def plot_statistics():
-    fig, axes = plt.subplots(1, 2, figsize=(10, 5))
+
+def analyze_shard(topic, start_date, end_date, source):
+    """一個月份的情緒分布和每日統計，已建立每日彙總表時讀取彙總表"""
+    context = AnalysisContext(topic, start_date, end_date, source, use_rollup=True)
+    return context.aggregate, context.daily_stats
+
+
+def analyze_in_shards(topic, start_date, end_date, source):
+    """
+    依月份分段，同時分析多個月份，每完成一個月份就 yield 一次目前累計的結果
+    generator 被關閉時 (例如使用者中止串流) 取消還沒開始的月份
+
+    yield: (已完成月份數, 總月份數, 累計的 SentimentAggregate, 累計的每日統計 DataFrame)
+    """
+    import pandas as pd
+
+    shards = month_shards(start_date, end_date)
+    futures = [
+        shard_executor.submit(analyze_shard, topic, shard_start, shard_end, source)
+        for shard_start, shard_end in shards
+    ]
+
+    aggregate = SentimentAggregate()
+    daily_frames = []
+
+    def daily_stats():
+        # 各月份的日期不重疊，直接串接即可
+        if daily_frames:
+            return pd.concat(daily_frames).sort_index()
+        return pd.DataFrame({"mean": [], "count": []}, index=pd.DatetimeIndex([], name="date"))
+
+    if not shards:
+        # 結束日期早於開始日期，沒有任何月份
+        yield 0, 0, aggregate, daily_stats()
+        return
+
+    try:
+        for done, future in enumerate(as_completed(futures), start=1):
+            shard_aggregate, shard_daily = future.result()
+            aggregate.merge(shard_aggregate)
+            if not shard_daily.empty:
+                daily_frames.append(shard_daily)
+            yield done, len(shards), aggregate, daily_stats()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def analysis_to_dict(aggregate, daily_stats, start_date, end_date, resolution="auto"):
+    """
+    /analyze 的 JSON 格式：只回傳統計數列，由瀏覽器繪製圖表
+    daily_stats: 每日平均 sentiment 和筆數 (見 AnalysisContext.daily_stats)
+    resolution: 時間序列的解析度，"auto"、"day"、"week" 或 "month"
+
+    return: {"emotion_counts": ..., "star_counts": ...,
+             "series": {"resolution", "dates", "mean", "rolling_mean", "count"}}
+    """
+    resolution, series = resample_daily(daily_stats, resolution, start_date, end_date)
+
+    def to_list(values):
+        # 沒有文章的期間為 NaN，JSON 中以 null 表示
+        return [None if np.isnan(value) else round(float(value), 4) for value in values]
+
+    return {
+        **aggregate.to_dict(),
+        "series": {
+            "resolution": resolution,
+            "dates": series.index.strftime("%Y-%m-%d").tolist(),
+            "mean": to_list(series["mean"]),
+            "rolling_mean": to_list(series["rolling_mean"]),
+            "count": series["count"].astype(int).tolist(),
+        },
+    }
+
+
+def figure_to_base64(fig):
+    # Convert the plot to a Base64-encoded PNG image
+    buf = BytesIO()
+    fig.savefig(buf, format="png")
+    buf.seek(0)
+    return base64.b64encode(buf.getvalue()).decode("utf-8")
+
+
+def plot_statistics(aggregate):
+    from matplotlib.figure import Figure
+
+    # 使用 Figure 物件而不是 pyplot，避免多個執行緒共用 pyplot 的全域狀態
+    fig = Figure(figsize=(10, 5))
+    axes = fig.subplots(1, 2)
 
     # Emotion Distribution
-    emotions = list(emotion_counts.keys())
-    emotion_values = list(emotion_counts.values())
+    emotions = list(aggregate.emotion_counts.keys())
+    emotion_values = list(aggregate.emotion_counts.values())
     axes[0].bar(emotions, emotion_values, color=["#84C1FF", "#FFE66F", "#FF5151"])
     axes[0].set_title("Emotion Distribution")
     axes[0].set_xlabel("Emotion Type")
     axes[0].set_ylabel("Count")
 
     # Star Rating Distribution
-    stars = list(star_counts.keys())
-    star_values = list(star_counts.values())
+    stars = list(aggregate.star_counts.keys())
+    star_values = list(aggregate.star_counts.values())
     axes[1].bar(stars, star_values, color="#CA8EFF")
     axes[1].set_title("Star Rating Distribution")
     axes[1].set_xlabel("Star Rating")
     axes[1].set_ylabel("Count")
 
-    plt.tight_layout()
+    fig.tight_layout()
 
     # Convert the plot to PNG image
-    buf = BytesIO()
-    plt.savefig(buf, format="png")
-    plt.close(fig)
-    buf.seek(0)
-    image_base64 = base64.b64encode(buf.getvalue()).decode("utf-8")
-    return image_base64
+    return figure_to_base64(fig)
 
 
 # 按時間順序繪製這些情緒變化
-def plot_sentiment_timeseries(topic, start_date, end_date, source):
+def plot_sentiment_timeseries(topic, start_date, end_date, source, context=None, resolution="auto"):
+    import pandas as pd
+    from matplotlib.figure import Figure
+
     # Retrieve the relevant news IDs and their associated dates
-    news_ids = fetch_news_ids(topic, start_date, end_date, source)
-    news_dates = fetch_date_data(
-        news_ids, topic
-    )  # Returns "news_id", "date", "db_index"
-    sentiment_data = fetch_sentiment_data(
-        news_ids, topic
-    )  # Returns "news_id", "sentiment", "emotion", "star", "db_index"
-
-    # Convert lists to DataFrames for easier merging
-    news_dates_df = pd.DataFrame(news_dates)
-    sentiment_data_df = pd.DataFrame(sentiment_data)
-
-    # 合併時指定不同的欄位名稱
-    combined_data = pd.merge(
-        news_dates_df, sentiment_data_df, left_on="id", right_on="news_id", how="inner"
-    )
+    if context is None:
+        context = AnalysisContext(topic, start_date, end_date, source)
+
+    daily_stats = context.daily_stats
 
-    # Confirm the data contains the "date" column; otherwise, return an error message
-    if "date" not in combined_data.columns:
+    # Confirm there is dated sentiment data; otherwise, return an error message
+    if daily_stats.empty:
         print("No date information available in the sentiment data.")
         return None
 
-    # Convert the date column to datetime format and sort by date
-    combined_data["date"] = pd.to_datetime(combined_data["date"])
     # 檢查日期範圍
-    print(combined_data["date"].min(), combined_data["date"].max())
-    combined_data = combined_data.sort_values("date")
+    print(daily_stats.index.min(), daily_stats.index.max())
 
-    # Calculate the daily average sentiment score
-    daily_sentiment = combined_data.groupby("date")["sentiment"].mean()
+    # 長時間範圍改以週或月為單位，點數不會隨天數增加
+    resolution, series = resample_daily(daily_stats, resolution, start_date, end_date)
 
     # Plot
-    fig, ax = plt.subplots(figsize=(10, 5))
-    daily_sentiment.plot(ax=ax, color="#84C1FF", linestyle="-")
+    fig = Figure(figsize=(10, 5))
+    ax = fig.subplots()
+    ax.plot(
+        series.index, series["mean"], color="#84C1FF", linestyle="-", marker=".", alpha=0.6,
+        label=f"Average ({resolution})",
+    )
+    ax.plot(
+        series.index, series["rolling_mean"], color="#FF5151", linewidth=1.5,
+        label=f"Rolling average ({ROLLING_WINDOWS[resolution]} {resolution}s)",
+    )
     ax.set_title(f"Sentiment Trend from {start_date} to {end_date}")
     ax.set_xlabel("Date")
     ax.set_ylabel("Average Sentiment")
     ax.axhline(0, color="gray", linestyle="--", linewidth=0.5)
+    ax.legend(loc="upper right")
 
     # 設定橫軸範圍
     ax.set_xlim(pd.to_datetime(start_date), pd.to_datetime(end_date))
 
-    plt.xticks(rotation=45)
-    plt.tight_layout()
+    ax.tick_params(axis="x", labelrotation=45)
+    fig.tight_layout()
 
     # Convert the plot to a Base64-encoded PNG image
-    buf = BytesIO()
-    plt.savefig(buf, format="png")
-    plt.close(fig)
-    buf.seek(0)
-    image_base64 = base64.b64encode(buf.getvalue()).decode("utf-8")
-
-    return image_base64
+    return figure_to_base64(fig)